@@ -1,34 +1,112 @@
 from dotenv import load_dotenv
+import atexit
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from services.gemini_service import GeminiService
+from services.chat_history_service import ChatHistoryManager
+from services.conversation_log_service import ConversationLogWriter
+from services.export_cache_service import ExportCache
+from services.export_job_service import ExportJobManager, job_status
+from services.export_service import (
+    MIMETYPES as EXPORT_MIMETYPES,
+    export_info,
+    export_projection,
+    export_row,
+    iter_csv,
+    iter_json,
+    iter_ndjson,
+    restamp_json,
+    write_pdf,
+)
+from services.health_log_service import (
+    RESOLUTIONS,
+    ROLLUP_METRICS,
+    ROLLUP_RESOLUTIONS,
+    bump_data_version,
+    data_version,
+    date_range_filter,
+    ensure_indexes as ensure_health_log_indexes,
+    format_bucket,
+    rollup_pipeline,
+    rollup_range_filter,
+    to_log_date,
+    update_rollups,
+)
+from services.keyword_service import KeywordAutomaton
+from services.ocr_service import OCRBusy, OCRExecutor, extractor_for
+from services.phi_service import (
+    BATCH_CHUNK_SIZE as PHI_BATCH_CHUNK_SIZE,
+    anonymize as anonymize_phi,
+    anonymize_batch,
+)
+from services.prescription_service import (
+    REUSABLE_FIELDS as PRESCRIPTION_REUSABLE_FIELDS,
+    PrescriptionPipeline,
+    find_processed,
+    new_stages as new_prescription_stages,
+    save_content_addressed,
+)
+from services.response_cache_service import (
+    MemoryResponseCache,
+    MongoResponseCache,
+    response_cache_key,
+)
+from services.worker_service import current_worker, process_pool_context
 import json
-import csv
-import io
+import itertools
+import time
 import re
 import hashlib
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
 
-import PyPDF2
 from werkzeug.utils import secure_filename
-import pytesseract
-from PIL import Image
 UPLOAD_FOLDER = 'uploads/prescriptions'
+EXPORT_FORMATS = {'csv', 'ndjson', 'json', 'pdf'}
+EXPORT_JOB_FOLDER = 'exports/jobs'
+EXPORT_CACHE_FOLDER = 'exports/cache'
+PREVIEW_ROWS = 10
+PHI_BATCH_MAX_TEXTS = 10000
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def parse_export_request(data):
+    """Read export options from a request body; returns (options, error message)."""
+    options = {
+        "user_id": data.get("user_id") or "anonymous",
+        "categories": data.get("categories", []),
+        "start_date": data.get("start_date"),
+        "end_date": data.get("end_date"),
+        "export_format": data.get("format", "csv"),
+    }
+
+    try:
+        start = datetime.strptime(options["start_date"], "%Y-%m-%d") if options["start_date"] else None
+        end = datetime.strptime(options["end_date"], "%Y-%m-%d") if options["end_date"] else None
+    except (TypeError, ValueError):
+        return options, "Invalid date format"
+
+    if start and start > datetime.now():
+        return options, "Start date cannot be in the future."
+
+    if start and end and end < start:
+        return options, "Start date must not be after end date."
+
+    if options["export_format"] not in EXPORT_FORMATS:
+        return options, "Unsupported export format"
+
+    return options, None
+
 load_dotenv()
 
+# Medications per upload that get their own model summary
+MED_SUMMARY_LIMIT = int(os.getenv("PRESCRIPTION_MED_SUMMARIES", "3"))
+
 # Initialize Gemini service
 gemini_service = None
 try:
@@ -37,34 +115,13 @@ try:
 except ValueError as e:
     print(f"⚠️ Warning: {e}")
 
-# 🔐 PHI PATTERNS (Protected Health Information)
-PHI_PATTERNS = {
-    'name': r'\b(?:my name is|i am|i\'m|called)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b',
-    'ssn': r'\b\d{3}-\d{2}-\d{4}\b',
-    'phone': r'\b(?:\+?1[-.]?)?\(?\d{3}\)?[-.]?\d{3}[-.]?\d{4}\b',
-    'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-    'dob': r'\b(?:\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4})\b',
-    'address': r'\b\d+\s+[A-Za-z0-9\s]+(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln)\b'
-}
-
 class PHIAnonymizer:
     """Anonymize Protected Health Information"""
     
     @staticmethod
     def anonymize(text):
         """Replace PHI with tokens"""
-        anonymized = text
-        replacements = {}
-        
-        for category, pattern in PHI_PATTERNS.items():
-            matches = list(re.finditer(pattern, text, re.IGNORECASE))
-            for i, match in enumerate(matches):
-                original = match.group(0)
-                token = f"[{category.upper()}_{i}]"
-                anonymized = anonymized.replace(original, token, 1)
-                replacements[token] = category
-        
-        return anonymized, replacements
+        return anonymize_phi(text)
     
     @staticmethod
     def hash_identifier(text):
@@ -84,25 +141,54 @@ class ResponseFilter:
         'GENERAL': []
     }
     
+    EMERGENCY_TERMS = ['emergency', 'cant breathe', "can't breathe", 'chest pain',
+                       'severe bleeding', 'unconscious', 'overdose', 'suicide']
+
+    # Every classification keyword and emergency term, matched in one pass
+    AUTOMATON = KeywordAutomaton({**CLASSIFICATIONS, 'EMERGENCY_TERM': EMERGENCY_TERMS})
+
+    @staticmethod
+    def scan(text):
+        """Classify query type and detect emergencies; returns (category, is_emergency)"""
+        found = ResponseFilter.AUTOMATON.find(text.lower())
+
+        # First matching category in CLASSIFICATIONS order wins
+        category = next(
+            (category for category in ResponseFilter.CLASSIFICATIONS if category in found),
+            'GENERAL',
+        )
+        return category, 'EMERGENCY_TERM' in found
+
     @staticmethod
     def classify(text):
         """Classify query type"""
-        text_lower = text.lower()
-        
-        for category, keywords in ResponseFilter.CLASSIFICATIONS.items():
-            if category == 'GENERAL':
-                continue
-            if any(keyword in text_lower for keyword in keywords):
-                return category
-        
-        return 'GENERAL'
+        return ResponseFilter.scan(text)[0]
     
     @staticmethod
     def is_emergency(text):
         """Detect emergency situations"""
-        emergency_terms = ['emergency', 'cant breathe', "can't breathe", 'chest pain', 
-                          'severe bleeding', 'unconscious', 'overdose', 'suicide']
-        return any(term in text.lower() for term in emergency_terms)
+        return ResponseFilter.scan(text)[1]
+
+# Chat prompt; its hash is part of every response cache key, so editing the
+# template invalidates cached answers
+CHAT_PROMPT_TEMPLATE = """You are Baymax, a health information assistant.
+
+    Rules:
+    1. Provide general, educational health information.
+    2. You may mention common over‑the‑counter options and self‑care steps that are usually safe for most adults, but do NOT customize doses or make decisions for the user.
+    3. Do NOT diagnose specific conditions or tell the user exactly what they personally should do.
+    4. Always suggest talking to a healthcare provider for diagnosis or treatment decisions.
+
+    {history_section}
+
+    {prescription_context}
+
+    Query Type: {classification}
+    User Question: "{message}"
+
+    Answer in 2–3 sentences with practical, general information:
+    """
+CHAT_PROMPT_HASH = hashlib.sha256(CHAT_PROMPT_TEMPLATE.encode()).hexdigest()[:16]
 
 def create_app():
     app = Flask(__name__)
@@ -126,135 +212,239 @@ def create_app():
     except Exception as e:
         print(f"⚠️ TTL index warning: {e}")
 
+    # Chat history is always read per user, newest first
+    try:
+        db.chat_conversations.create_index([("user_id_hash", 1), ("timestamp", -1)])
+        print("✅ History index created for chat conversations")
+    except Exception as e:
+        print(f"⚠️ History index warning: {e}")
+
+    # Repeat uploads are matched by content hash
+    try:
+        db.prescriptions.create_index("content_hash")
+        print("✅ Content hash index created for prescriptions")
+    except Exception as e:
+        print(f"⚠️ Prescription index warning: {e}")
+
+    # Conversation turns are written in batches off the request path
+    conversation_log = ConversationLogWriter(
+        db.chat_conversations,
+        durability=os.getenv("CONVERSATION_LOG_DURABILITY", "async"),
+        batch_size=int(os.getenv("CONVERSATION_LOG_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("CONVERSATION_LOG_FLUSH_SECONDS", "0.5")),
+    )
+    atexit.register(conversation_log.close)
+
+    # Prompt history: recent turns within a token budget plus a rolling summary
+    chat_history = ChatHistoryManager(
+        db,
+        lambda prompt: gemini_service.chat(prompt),
+        token_budget=int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1200")),
+        summary_every=int(os.getenv("CHAT_SUMMARY_EVERY", "10")),
+    )
+    try:
+        chat_history.ensure_indexes(expire_after_seconds=7776000)
+    except Exception as e:
+        print(f"⚠️ Chat summary index warning: {e}")
+
+    # Answers to generic (history- and prescription-free) questions
+    response_cache = None
+    cache_backend = os.getenv("CHAT_CACHE_BACKEND", "memory")
+    cache_options = {
+        "max_entries": int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000")),
+        "ttl_seconds": int(os.getenv("CHAT_CACHE_TTL_SECONDS", "86400")),
+    }
+    if cache_backend == "memory":
+        response_cache = MemoryResponseCache(**cache_options)
+    elif cache_backend == "mongo":
+        response_cache = MongoResponseCache(db.chat_response_cache, **cache_options)
+        try:
+            response_cache.ensure_indexes()
+        except Exception as e:
+            print(f"⚠️ Response cache index warning: {e}")
+
+    # Compound index so date range queries only touch logs inside the window
+    try:
+        ensure_health_log_indexes(db)
+        print("✅ Date index created for health logs")
+    except Exception as e:
+        print(f"⚠️ Health log index warning: {e}")
+
+    # Background export workers (job state in Mongo, files on local disk)
+    export_jobs = ExportJobManager(
+        db,
+        EXPORT_JOB_FOLDER,
+        max_workers=int(os.getenv("EXPORT_JOB_WORKERS", "2")),
+        stale_seconds=int(os.getenv("EXPORT_JOB_STALE_SECONDS", "3600")),
+    )
+    atexit.register(export_jobs.shutdown)
+    try:
+        export_jobs.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Export job index warning: {e}")
+
+    # Jobs whose worker exited before finishing will never complete
+    try:
+        failed = export_jobs.fail_orphaned()
+        if failed:
+            print(f"⚠️ Marked {failed} interrupted export jobs as failed")
+    except Exception as e:
+        print(f"⚠️ Export job recovery warning: {e}")
+
+    # Rendered exports keyed by options + per-user data version
+    export_cache = ExportCache(
+        EXPORT_CACHE_FOLDER,
+        max_bytes=int(os.getenv("EXPORT_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    )
+
+    # Worker processes for batch PHI anonymization (started on first use)
+    phi_pool = ProcessPoolExecutor(
+        max_workers=int(os.getenv("PHI_BATCH_WORKERS", "2")),
+        mp_context=process_pool_context(),
+    )
+    atexit.register(phi_pool.shutdown, wait=False, cancel_futures=True)
+
+    # Worker processes for prescription OCR, with a bounded queue
+    ocr_executor = OCRExecutor(
+        max_workers=int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1))),
+        max_queue=int(os.getenv("OCR_MAX_QUEUE", "4")),
+    )
+    atexit.register(ocr_executor.shutdown)
+
+    # Background processing of uploaded prescriptions
+    prescription_pipeline = PrescriptionPipeline(
+        db.prescriptions,
+        ocr_executor,
+        parse=lambda text: parse_prescription(text),
+        explain=lambda text, medications: generate_prescription_insights(text, medications),
+        max_workers=int(os.getenv("PRESCRIPTION_WORKERS", "4")),
+        max_pending=int(os.getenv("PRESCRIPTION_MAX_PENDING", "16")),
+        stale_seconds=int(os.getenv("PRESCRIPTION_STALE_SECONDS", "900")),
+    )
+
+    # Uploads whose worker exited before finishing would stay pending forever
+    try:
+        requeued, failed = prescription_pipeline.recover()
+        if requeued or failed:
+            print(f"⚠️ Requeued {requeued} interrupted prescriptions, marked {failed} failed")
+    except Exception as e:
+        print(f"⚠️ Prescription recovery warning: {e}")
+
     # ----------------- Health check -----------------
     @app.route("/health", methods=["GET"])
     def health():
         return jsonify({"status": "healthy", "database": "connected"})
 
     # ----------------- Chat (Gemini) with ANONYMIZATION AND PRESCRIPTION CONTEXT -----------------
-    @app.route("/api/chat", methods=["POST"])
-    def chat():
-        """Chat endpoint with PHI anonymization, filtering, prescription context, and conversation history."""
-        if gemini_service is None:
-            return jsonify({"error": "Gemini API not configured"}), 500
-
-        try:
-            data = request.json
-            user_message = data.get("message", "")
-            user_id = data.get("user_id", "anonymous")
-            prescription_id = data.get("prescription_id")
-
-            if not user_message:
-                return jsonify({"error": "No message provided"}), 400
+    def prepare_chat(data):
+        """
+        Shared chat pipeline up to the model call.
 
-            # 1️⃣ ANONYMIZE USER INPUT
-            anon_message, phi_map = PHIAnonymizer.anonymize(user_message)
-            user_hash = PHIAnonymizer.hash_identifier(user_id)
+        Returns (reply, status, None) when the turn is answered without the
+        model (bad request, emergency or PHI refusal; already logged), or
+        (None, None, turn) with the prompt and what finish_chat needs.
+        """
+        user_message = data.get("message", "")
+        user_id = data.get("user_id", "anonymous")
+        prescription_id = data.get("prescription_id")
+
+        if not user_message:
+            return {"error": "No message provided"}, 400, None
+
+        # 1️⃣ ANONYMIZE USER INPUT
+        anon_message, phi_map = PHIAnonymizer.anonymize(user_message)
+        user_hash = PHIAnonymizer.hash_identifier(user_id)
+
+        # 2️⃣ CHECK FOR EMERGENCY (and classify in the same scan)
+        classification, is_emergency = ResponseFilter.scan(user_message)
+        if is_emergency:
+            emergency_response = {
+                "response": "🚨 EMERGENCY DETECTED\n\nPlease call 911 immediately or go to the nearest emergency room.",
+                "classification": "EMERGENCY",
+                "anonymized": True,
+                "phi_detected": len(phi_map) > 0,
+                "timestamp": datetime.now().isoformat()
+            }
 
-            # 2️⃣ CHECK FOR EMERGENCY
-            if ResponseFilter.is_emergency(user_message):
-                emergency_response = {
-                    "response": "🚨 EMERGENCY DETECTED\n\nPlease call 911 immediately or go to the nearest emergency room.",
-                    "classification": "EMERGENCY",
-                    "anonymized": True,
-                    "phi_detected": len(phi_map) > 0,
-                    "timestamp": datetime.now().isoformat()
-                }
+            log_conversation(
+                conversation_log,
+                user_hash,
+                anon_message,
+                emergency_response["response"],
+                "EMERGENCY",
+                phi_map,
+                True
+            )
 
-                log_conversation(
-                    db,
-                    user_hash,
-                    anon_message,
-                    emergency_response["response"],
-                    "EMERGENCY",
-                    phi_map,
-                    True
-                )
+            return emergency_response, 200, None
 
-                return jsonify(emergency_response), 200
+        # 3️⃣ IF PHI DETECTED, REFUSE TO ANSWER
+        if len(phi_map) > 0:
+            phi_response = (
+                "⚠️ I've detected personal health information in your message. "
+                "For your privacy and safety, I cannot provide personalized medical advice. "
+                "Please consult a healthcare provider directly for questions about your specific situation."
+            )
 
-            # 3️⃣ IF PHI DETECTED, REFUSE TO ANSWER
-            if len(phi_map) > 0:
-                phi_response = (
-                    "⚠️ I've detected personal health information in your message. "
-                    "For your privacy and safety, I cannot provide personalized medical advice. "
-                    "Please consult a healthcare provider directly for questions about your specific situation."
-                )
+            log_conversation(
+                conversation_log,
+                user_hash,
+                anon_message,
+                phi_response,
+                "PHI_DETECTED",
+                phi_map,
+                True
+            )
 
-                log_conversation(
-                    db,
-                    user_hash,
-                    anon_message,
-                    phi_response,
-                    "PHI_DETECTED",
-                    phi_map,
-                    True
-                )
+            return {
+                "response": phi_response,
+                "classification": "PHI_DETECTED",
+                "anonymized": True,
+                "phi_detected": True,
+                "timestamp": datetime.now().isoformat()
+            }, 200, None
 
-                return jsonify({
-                    "response": phi_response,
-                    "classification": "PHI_DETECTED",
-                    "anonymized": True,
-                    "phi_detected": True,
-                    "timestamp": datetime.now().isoformat()
-                }), 200
+        # 4️⃣ NO PHI → ANSWER NORMALLY
+        # (without PHI, anon_message == user_message, so the scan above applies)
 
-            # 4️⃣ NO PHI → ANSWER NORMALLY
-            classification = ResponseFilter.classify(anon_message)
+        # 5️⃣ LOAD CONVERSATION HISTORY (last 30 messages)
+        history_text = ""
+        try:
+            history = conversation_log.recent(
+                user_hash,
+                30,
+                ["user_message", "bot_response", "classification", "timestamp"],
+            )
 
-            # 5️⃣ LOAD CONVERSATION HISTORY (last 30 messages)
+            # Start fresh after a PHI refusal; otherwise trim to the token
+            # budget with a rolling summary of older turns
+            if history and history[0].get("classification") != "PHI_DETECTED":
+                history_text = chat_history.history_text(user_hash, history)
+        except Exception as e:
+            print(f"Error loading conversation history: {e}")
             history_text = ""
-            try:
-                history_cursor = db.chat_conversations.find(
-                    {"user_id_hash": user_hash}
-                ).sort("timestamp", -1).limit(30)
-
-                history = list(history_cursor)[::-1]  # oldest → newest
-
-                if history:
-                    history_lines = []
-                    for h in history:
-                        history_lines.append(f"User: {h.get('user_message', '')}")
-                        history_lines.append(f"Baymax: {h.get('bot_response', '')}")
-
-                    history_text = "\n".join(history_lines[-60:])  # cap at 60 lines
-            except Exception as e:
-                print(f"Error loading conversation history: {e}")
-                history_text = ""
 
+        # 6️⃣ LOAD PRESCRIPTION CONTEXT
+        prescription_context = ""
 
+        # Try explicit prescription_id first
+        if prescription_id:
+            from bson.objectid import ObjectId
             try:
-                last_conv = db.chat_conversations.find_one(
-                    {"user_id_hash": user_hash},
-                    sort=[("timestamp", -1)]
-                )
-                if last_conv and last_conv.get("classification") == "PHI_DETECTED":
-                    history_text = ""
-            except Exception as e:
-                print(f"Error checking last conversation: {e}")
+                prescription = db.prescriptions.find_one({"_id": ObjectId(prescription_id)})
+                if prescription:
+                    meds = prescription.get("medications", [])
+                    med_list = "\n".join([f"- {m['name']} {m['dosage']}" for m in meds])
 
+                    warnings = prescription.get("warnings", [])
+                    warning_list = "\n".join([f"- {w}" for w in warnings])
 
-            # 6️⃣ LOAD PRESCRIPTION CONTEXT
-            prescription_context = ""
+                    allergies = prescription.get("allergies", [])
+                    allergy_list = "\n".join([f"- {a}" for a in allergies])
 
-            # Try explicit prescription_id first
-            if prescription_id:
-                from bson.objectid import ObjectId
-                try:
-                    prescription = db.prescriptions.find_one({"_id": ObjectId(prescription_id)})
-                    if prescription:
-                        meds = prescription.get("medications", [])
-                        med_list = "\n".join([f"- {m['name']} {m['dosage']}" for m in meds])
+                    excerpt = (prescription.get("extracted_text", "") or "")[:500]
 
-                        warnings = prescription.get("warnings", [])
-                        warning_list = "\n".join([f"- {w}" for w in warnings])
-
-                        allergies = prescription.get("allergies", [])
-                        allergy_list = "\n".join([f"- {a}" for a in allergies])
-
-                        excerpt = (prescription.get("extracted_text", "") or "")[:500]
-
-                        prescription_context = f"""
+                    prescription_context = f"""
     PRESCRIPTION CONTEXT:
     The user has uploaded a prescription with:
 
@@ -270,30 +460,30 @@ def create_app():
     Prescription excerpt:
     {excerpt}
     """
-                except Exception as e:
-                    print(f"Error loading prescription by ID: {e}")
-
-            # Fallback: most recent prescription for this user
-            if not prescription_context:
-                try:
-                    latest_prescription = db.prescriptions.find_one(
-                        {"user_id_hash": user_hash},
-                        sort=[("uploaded_at", -1)]
-                    )
+            except Exception as e:
+                print(f"Error loading prescription by ID: {e}")
+
+        # Fallback: most recent prescription for this user
+        if not prescription_context:
+            try:
+                latest_prescription = db.prescriptions.find_one(
+                    {"user_id_hash": user_hash},
+                    sort=[("uploaded_at", -1)]
+                )
 
-                    if latest_prescription:
-                        meds = latest_prescription.get("medications", [])
-                        med_list = "\n".join([f"- {m['name']} {m['dosage']}" for m in meds])
+                if latest_prescription:
+                    meds = latest_prescription.get("medications", [])
+                    med_list = "\n".join([f"- {m['name']} {m['dosage']}" for m in meds])
 
-                        warnings = latest_prescription.get("warnings", [])
-                        warning_list = "\n".join([f"- {w}" for w in warnings])
+                    warnings = latest_prescription.get("warnings", [])
+                    warning_list = "\n".join([f"- {w}" for w in warnings])
 
-                        allergies = latest_prescription.get("allergies", [])
-                        allergy_list = "\n".join([f"- {a}" for a in allergies])
+                    allergies = latest_prescription.get("allergies", [])
+                    allergy_list = "\n".join([f"- {a}" for a in allergies])
 
-                        excerpt = (latest_prescription.get("extracted_text", "") or "")[:500]
+                    excerpt = (latest_prescription.get("extracted_text", "") or "")[:500]
 
-                        prescription_context = f"""
+                    prescription_context = f"""
     PRESCRIPTION CONTEXT (most recent on file):
     The user has a prescription with:
 
@@ -309,42 +499,84 @@ def create_app():
     Prescription excerpt:
     {excerpt}
     """
-                    else:
-                        prescription_context = ""
-                except Exception as e:
-                    print(f"Error loading latest prescription: {e}")
+                else:
                     prescription_context = ""
+            except Exception as e:
+                print(f"Error loading latest prescription: {e}")
+                prescription_context = ""
+
+        # 7️⃣ GENERATE RESPONSE WITH FULL CONTEXT
+        history_section = (
+            f"CONVERSATION HISTORY (last 30 exchanges):\n{history_text}\n" if history_text else ""
+        )
+        context_prompt = CHAT_PROMPT_TEMPLATE.format(
+            history_section=history_section,
+            prescription_context=prescription_context,
+            classification=classification,
+            message=anon_message,
+        )
+
+        # Prompts without history or prescription context are the same
+        # for everyone, so their answers can be reused
+        cache_key = None
+        cached_response = None
+        if response_cache and not history_text and not prescription_context:
+            cache_key = response_cache_key(anon_message, classification, CHAT_PROMPT_HASH)
+            cached_response = response_cache.get(cache_key)
+
+        return None, None, {
+            "user_hash": user_hash,
+            "anon_message": anon_message,
+            "classification": classification,
+            "phi_map": phi_map,
+            "prompt": context_prompt,
+            "cache_key": cache_key,
+            "cached_response": cached_response,
+        }
 
-            # 7️⃣ GENERATE RESPONSE WITH FULL CONTEXT
-            context_prompt = f"""You are Baymax, a health information assistant.
-
-    Rules:
-    1. Provide general, educational health information.
-    2. You may mention common over‑the‑counter options and self‑care steps that are usually safe for most adults, but do NOT customize doses or make decisions for the user.
-    3. Do NOT diagnose specific conditions or tell the user exactly what they personally should do.
-    4. Always suggest talking to a healthcare provider for diagnosis or treatment decisions.
-
-    {f"CONVERSATION HISTORY (last 30 exchanges):\n{history_text}\n" if history_text else ""}
-
-    {prescription_context}
-
-    Query Type: {classification}
-    User Question: "{anon_message}"
-
-    Answer in 2–3 sentences with practical, general information:
-    """
+    def finish_chat(turn, bot_response, model_seconds=None):
+        """Cache a fresh model answer and log the completed exchange."""
+        # GeminiService reports failures as text; never cache those
+        if model_seconds is not None and turn["cache_key"] and not bot_response.startswith("Error:"):
+            response_cache.set(turn["cache_key"], bot_response, model_seconds)
+
+        # 8️⃣ LOG
+        log_conversation(
+            conversation_log,
+            turn["user_hash"],
+            turn["anon_message"],
+            bot_response,
+            turn["classification"],
+            turn["phi_map"],
+            False,
+        )
 
-            bot_response = gemini_service.chat(context_prompt)
-            final_response = bot_response
+    @app.route("/api/chat", methods=["POST"])
+    def chat():
+        """Chat endpoint with PHI anonymization, filtering, prescription context, and conversation history."""
+        if gemini_service is None:
+            return jsonify({"error": "Gemini API not configured"}), 500
 
-            # 8️⃣ LOG AND RETURN
-            log_conversation(db, user_hash, anon_message, final_response, classification, phi_map, False)
+        try:
+            reply, status, turn = prepare_chat(request.json)
+            if turn is None:
+                return jsonify(reply), status
+
+            final_response = turn["cached_response"]
+            cached = final_response is not None
+            if cached:
+                finish_chat(turn, final_response)
+            else:
+                started = time.perf_counter()
+                final_response = gemini_service.chat(turn["prompt"])
+                finish_chat(turn, final_response, time.perf_counter() - started)
 
             return jsonify({
                 "response": final_response,
-                "classification": classification,
+                "classification": turn["classification"],
                 "anonymized": True,
                 "phi_detected": False,
+                "cached": cached,
                 "timestamp": datetime.now().isoformat()
             }), 200
 
@@ -352,6 +584,115 @@ def create_app():
             print(f"❌ Chat error: {str(e)}")
             return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/chat/stream", methods=["POST"])
+    def chat_stream():
+        """Same pipeline as /api/chat, with the answer streamed as Server-Sent Events."""
+        if gemini_service is None:
+            return jsonify({"error": "Gemini API not configured"}), 500
+
+        try:
+            reply, status, turn = prepare_chat(request.json)
+        except Exception as e:
+            print(f"❌ Chat error: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+        if turn is None and status != 200:
+            return jsonify(reply), status
+
+        def events():
+            # Replies that never reach the model go out as a single chunk
+            if turn is None:
+                yield sse_event({"text": reply["response"]})
+                yield sse_event({key: value for key, value in reply.items() if key != "response"}, "done")
+                return
+
+            cached = turn["cached_response"] is not None
+            chunks = []
+            model_seconds = None
+            try:
+                if cached:
+                    chunks.append(turn["cached_response"])
+                    yield sse_event({"text": turn["cached_response"]})
+                else:
+                    started = time.perf_counter()
+                    failed = False
+                    for text in gemini_service.chat_stream(turn["prompt"]):
+                        # GeminiService ends a failed stream with an "Error: ..." chunk
+                        failed = failed or text.startswith("Error:")
+                        chunks.append(text)
+                        yield sse_event({"text": text})
+                    if not failed:
+                        model_seconds = time.perf_counter() - started
+
+                # Only a stream that ran to completion is cached and logged
+                finish_chat(turn, "".join(chunks), model_seconds)
+                yield sse_event({
+                    "classification": turn["classification"],
+                    "anonymized": True,
+                    "phi_detected": False,
+                    "cached": cached,
+                    "timestamp": datetime.now().isoformat()
+                }, "done")
+
+            except Exception as e:
+                print(f"❌ Chat stream error: {str(e)}")
+                yield sse_event({"error": str(e)}, "error")
+
+        return Response(
+            stream_with_context(events()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/api/chat/cache-stats", methods=["GET"])
+    def chat_cache_stats():
+        """Hit/miss counters for the generic-answer cache (this worker only)."""
+        if response_cache is None:
+            return jsonify({"backend": None}), 200
+        return jsonify(response_cache.stats()), 200
+
+    @app.route("/api/gemini/metrics", methods=["GET"])
+    def gemini_metrics():
+        """Queue depth, in-flight calls and circuit state for model calls (this worker only)."""
+        limiter = getattr(gemini_service, "limiter", None)
+        if limiter is None:
+            return jsonify({"state": None}), 200
+        return jsonify(limiter.metrics()), 200
+
+    # ----------------- Batch PHI anonymization -----------------
+    @app.route("/api/phi/anonymize-batch", methods=["POST"])
+    def anonymize_phi_batch():
+        """Anonymize a list of texts; large batches run across worker processes."""
+        try:
+            data = request.json or {}
+            texts = data.get("texts")
+
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                return jsonify({"error": "texts must be a list of strings"}), 400
+            if len(texts) > PHI_BATCH_MAX_TEXTS:
+                return jsonify({"error": f"At most {PHI_BATCH_MAX_TEXTS} texts per request"}), 400
+
+            # A single chunk isn't worth the round trip to a worker process
+            executor = phi_pool if len(texts) > PHI_BATCH_CHUNK_SIZE else None
+
+            started = time.perf_counter()
+            results = [
+                {"anonymized": anonymized, "replacements": replacements}
+                for anonymized, replacements in anonymize_batch(texts, executor)
+            ]
+            elapsed = time.perf_counter() - started
+
+            return jsonify({
+                "results": results,
+                "count": len(results),
+                "seconds": round(elapsed, 3),
+                "docs_per_sec": round(len(results) / elapsed, 1) if elapsed else None,
+            }), 200
+
+        except Exception as e:
+            print(f"❌ Batch anonymize error: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
 
 
         # ----------------- Health logs API (from MongoDB) -----------------
@@ -372,12 +713,6 @@ def create_app():
                 start_str = request.args.get("start")
                 end_str = request.args.get("end")
 
-                # Fetch only this user's logs
-                logs = list(db.health_logs.find({"user_id": user_id}))
-
-                def parse_mmddyyyy(s: str):
-                    return datetime.strptime(s, "%m-%d-%Y").date()
-
                 start_date = (
                     datetime.strptime(start_str, "%Y-%m-%d").date()
                     if start_str
@@ -392,32 +727,16 @@ def create_app():
                 if start_date and end_date and start_date > end_date:
                     return jsonify({"error": "Start date must not be after end date."}), 400
 
-                filtered_logs = []
+                # Range query on {user_id, log_date}; the index also gives the sort order
+                filtered_logs = list(
+                    db.health_logs.find(
+                        date_range_filter(user_id, start_str, end_str)
+                    ).sort("log_date", 1)
+                )
 
-                for log in logs:
+                for log in filtered_logs:
                     log["_id"] = str(log["_id"])
 
-                    date_str = log.get("date")
-                    if not date_str:
-                        continue
-
-                    try:
-                        log_date = parse_mmddyyyy(date_str)
-                    except ValueError:
-                        continue
-
-                    if start_date and log_date < start_date:
-                        continue
-                    if end_date and log_date > end_date:
-                        continue
-
-                    filtered_logs.append(log)
-
-                # Sort by date ascending
-                filtered_logs.sort(
-                    key=lambda x: datetime.strptime(x["date"], "%m-%d-%Y")
-                )
-
                 if not filtered_logs:
                     # This is what your graph tests expect in the "no data" case
                     return jsonify({"error": "No health logs found between the selected date range."}), 404
@@ -429,244 +748,211 @@ def create_app():
                 print("❌ get_health_logs error:", e)
                 return jsonify({"error": str(e)}), 500
 
+    @app.route("/api/health-logs/aggregate", methods=["GET"])
+    def aggregate_health_logs():
+        """
+        Returns per-bucket means and counts for the Graph view. Week, month
+        and year buckets come from `health_log_rollups` and are returned whole,
+        even when the range starts or ends mid-bucket.
+
+        Query parameters:
+        - resolution: day | week | month | year (default: week)
+        - start / end: optional date range (YYYY-MM-DD)
+        - user_id: Supabase user ID; defaults to "anonymous"
+        """
+        try:
+            user_id = request.args.get("user_id") or "anonymous"
+            resolution = request.args.get("resolution", "week")
 
+            start_str = request.args.get("start")
+            end_str = request.args.get("end")
 
-    # ----------------- Export data (CSV, PDF, JSON) -----------------
-    @app.route("/api/export", methods=["POST"])
-    def export_data():
-        """Export health data in specified format (CSV, PDF, JSON)"""
-        try:
-            data = request.json
+            if resolution not in RESOLUTIONS:
+                return jsonify({"error": "Invalid resolution. Use day, week, month, or year."}), 400
 
-            user_id = data.get("user_id") or "anonymous"
+            try:
+                start_date = datetime.strptime(start_str, "%Y-%m-%d") if start_str else None
+                end_date = datetime.strptime(end_str, "%Y-%m-%d") if end_str else None
+            except ValueError:
+                return jsonify({"error": "Invalid date format"}), 400
 
-            categories = data.get("categories", [])
-            start_date = data.get("start_date")
-            end_date = data.get("end_date")
-            export_format = data.get("format", "csv")
+            if start_date and end_date and start_date > end_date:
+                return jsonify({"error": "Start date must not be after end date."}), 400
 
-            if not user_id:  # ✅ ADD
-                return jsonify({"error": "user_id is required"}), 400
+            if resolution in ROLLUP_RESOLUTIONS:
+                # Point lookups on the incrementally maintained rollups
+                rows = db.health_log_rollups.find(
+                    rollup_range_filter(user_id, resolution, start_str, end_str)
+                ).sort("bucket", 1)
+            else:
+                query = date_range_filter(user_id, start_str, end_str)
+                rows = db.health_logs.aggregate(rollup_pipeline(query, resolution))
 
-            logs = list(db.health_logs.find({"user_id": user_id}))
+            buckets = [format_bucket(row) for row in rows]
 
-            # Fetch from MongoDB instead of seed file
-            #logs = list(db.health_logs.find())
-            
-            if start_date:
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                now = datetime.now()
-                if start > now:
-                    return jsonify({"error": "Start date cannot be in the future."}), 400
+            if not buckets:
+                return jsonify({"error": "No health logs found between the selected date range."}), 404
+
+            return jsonify({"resolution": resolution, "buckets": buckets}), 200
+
+        except Exception as e:
+            print("❌ aggregate_health_logs error:", e)
+            return jsonify({"error": str(e)}), 500
 
-            # Apply date filtering (MongoDB dates are MM-DD-YYYY)
-            if start_date or end_date:
-                filtered_logs = []
-                for log in logs:
-                    try:
-                        # Parse MM-DD-YYYY format from MongoDB
-                        log_date = datetime.strptime(log["date"], "%m-%d-%Y")
-
-                        if start_date:
-                            start = datetime.strptime(start_date, "%Y-%m-%d")
-                            if log_date < start:
-                                continue
-
-                        if end_date:
-                            end = datetime.strptime(end_date, "%Y-%m-%d")
-                            if log_date > end:
-                                continue
-
-                        filtered_logs.append(log)
-                    except (ValueError, KeyError):
-                        continue
-                logs = filtered_logs
-
-            # Filter by categories
-            if categories:
-                filtered_logs = []
-                for log in logs:
-                    filtered_log = {"date": log["date"]}
-
-                    if "sleep" in categories and log.get("sleepHours") is not None:
-                        filtered_log["sleepHours"] = log["sleepHours"]
-
-                    if "symptoms" in categories and log.get("symptom"):
-                        filtered_log["symptom"] = log["symptom"]
-
-                    if "mood" in categories and log.get("mood") is not None:
-                        filtered_log["mood"] = log["mood"]
-
-                    if "medications" in categories and log.get("tookMedication") is not None:
-                        filtered_log["tookMedication"] = log["tookMedication"]
-
-                    if "vital_signs" in categories and log.get("vital_bpm") is not None:
-                        filtered_log["vital_bpm"] = log["vital_bpm"]
-                    
-                    # Include note if it exists
-                    if log.get("note"):
-                        filtered_log["note"] = log["note"]
-
-                    filtered_logs.append(filtered_log)
-                logs = filtered_logs
-
-            # Convert ObjectId to string for JSON serialization
-            health_logs = []
-            for log in logs:
-                log_copy = log.copy()
-                if "_id" in log_copy:
-                    log_copy["_id"] = str(log_copy["_id"])
-                # Remove MongoDB-specific fields
-                log_copy.pop("created_at", None)
-                log_copy.pop("updated_at", None)
-                health_logs.append(log_copy)
-
-
-
-            # ---- CSV export ----
-            if export_format == "csv":
-                if not health_logs:
-                    return jsonify({"error": "No data found between the selected date range."}), 404
-                
-                output = io.StringIO()
-                fieldnames = list(health_logs[0].keys())
-                writer = csv.DictWriter(output, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(health_logs)
-
-                output.seek(0)
-                file_output = io.BytesIO()
-                file_output.write(output.getvalue().encode("utf-8"))
-                file_output.seek(0)
 
+
+    # ----------------- Export data (CSV, PDF, JSON) -----------------
+    @app.route("/api/export", methods=["POST"])
+    def export_data():
+        """Export health data in specified format (CSV, NDJSON, JSON, PDF)"""
+        try:
+            options, error = parse_export_request(request.json)
+            if error:
+                return jsonify({"error": error}), 400
+
+            user_id = options["user_id"]
+            categories = options["categories"]
+            start_date = options["start_date"]
+            end_date = options["end_date"]
+            export_format = options["export_format"]
+
+            # Date filtering runs in MongoDB on the indexed log_date; only the
+            # selected categories' fields are fetched
+            query = date_range_filter(user_id, start_date, end_date)
+            projection = export_projection(categories)
+
+            export_filename = f"health_data_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+
+            # Repeat exports of unchanged data are served from the on-disk cache
+            cache_key = export_cache.key(
+                user_id, start_date, end_date, categories, export_format, data_version(db, user_id)
+            )
+            cached_path = export_cache.get(cache_key, export_format)
+            if cached_path:
+                # JSON reports when it was served; a PDF keeps its render time
+                if export_format == "json":
+                    return Response(
+                        stream_with_context(restamp_json(cached_path, datetime.now())),
+                        mimetype=EXPORT_MIMETYPES[export_format],
+                        headers={"Content-Disposition": f"attachment; filename={export_filename}"},
+                    )
                 return send_file(
-                    file_output,
+                    os.path.abspath(cached_path),
                     as_attachment=True,
-                    download_name=f"health_data_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mimetype="text/csv",
+                    download_name=export_filename,
+                    mimetype=EXPORT_MIMETYPES[export_format],
                 )
 
-            # PDF export
-            elif export_format == "pdf":
-                file_output = io.BytesIO()
-                doc = SimpleDocTemplate(file_output, pagesize=letter)
-                styles = getSampleStyleSheet()
-                story = []
-
-                title_style = ParagraphStyle(
-                    "CustomTitle",
-                    parent=styles["Heading1"],
-                    fontSize=18,
-                    spaceAfter=30,
-                    alignment=1,
-                )
-                story.append(Paragraph("Baymax Health Data Export", title_style))
+            # ---- CSV export (streamed straight from the cursor) ----
+            if export_format == "csv":
+                cursor = db.health_logs.find(query, projection).sort("log_date", 1)
+                first = next(cursor, None)
+                if first is None:
+                    cursor.close()
+                    return jsonify({"error": "No data found between the selected date range."}), 404
 
-                info_style = styles["Normal"]
-                story.append(
-                    Paragraph(
-                        f"<b>Generated:</b> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}",
-                        info_style,
-                    )
-                )
-                story.append(
-                    Paragraph(f"<b>Date Range:</b> {start_date or 'All'} to {end_date or 'All'}", info_style)
-                )
-                story.append(
-                    Paragraph(f"<b>Categories:</b> {', '.join(categories) if categories else 'All'}", info_style)
-                )
-                story.append(
-                    Paragraph(f"<b>Total Records:</b> {len(health_logs)}", info_style)
-                )
-                story.append(Spacer(1, 20))
-
-                if health_logs:
-                    fieldnames = list(health_logs[0].keys())
-                    headers = [name.replace("_", " ").title() for name in fieldnames]
-                    table_data = [headers]
-
-                    for log in health_logs:
-                        row = []
-                        for field in fieldnames:
-                            value = log.get(field, "N/A")
-                            if value is None:
-                                value = "N/A"
-                            elif isinstance(value, bool):
-                                value = "Yes" if value else "No"
-                            row.append(str(value))
-                        table_data.append(row)
-
-                    table = Table(table_data)
-                    table.setStyle(
-                        TableStyle(
-                            [
-                                ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-                                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                                ("FONTSIZE", (0, 0), (-1, 0), 10),
-                                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                                ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-                                ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-                                ("FONTSIZE", (0, 1), (-1, -1), 8),
-                                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                            ]
-                        )
-                    )
+                chunks = iter_csv(itertools.chain([first], cursor), categories)
 
-                    story.append(table)
-                else:
-                    story.append(
-                        Paragraph(
-                            "No data found for the selected criteria.",
-                            styles["Normal"],
-                        )
-                    )
+            # ---- NDJSON export (one record per line, streamed) ----
+            elif export_format == "ndjson":
+                cursor = db.health_logs.find(query, projection).sort("log_date", 1)
+                chunks = iter_ndjson(cursor, categories)
 
-                doc.build(story)
-                file_output.seek(0)
+            # ---- JSON export (envelope streamed record by record) ----
+            elif export_format == "json":
+                info = export_info(categories, start_date, end_date, db.health_logs.count_documents(query))
+                cursor = db.health_logs.find(query, projection).sort("log_date", 1)
+                chunks = iter_json(cursor, categories, info)
+
+            # ---- PDF export (page-sized LongTable chunks, rendered into the cache) ----
+            else:
+                pdf_path = export_cache.store_file(
+                    cache_key,
+                    export_format,
+                    lambda path: write_pdf(
+                        path,
+                        db.health_logs.find(query, projection).sort("log_date", 1),
+                        categories,
+                        db.health_logs.count_documents(query),
+                        start_date,
+                        end_date,
+                    ),
+                )
 
                 return send_file(
-                    file_output,
+                    os.path.abspath(pdf_path),
                     as_attachment=True,
-                    download_name=f"health_data_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                    mimetype="application/pdf",
+                    download_name=export_filename,
+                    mimetype=EXPORT_MIMETYPES[export_format],
                 )
 
-            # JSON export
-            elif export_format == "json":
-                output = json.dumps(
-                    {
-                        "export_info": {
-                            "generated_at": datetime.now().isoformat(),
-                            "date_range": {
-                                "start": start_date or "All",
-                                "end": end_date or "All",
-                            },
-                            "categories": categories if categories else "All",
-                            "total_records": len(health_logs),
-                        },
-                        "data": health_logs,
-                    },
-                    indent=2,
-                )
+            # Streamed formats are written to the cache as they go out
+            return Response(
+                stream_with_context(export_cache.store_stream(cache_key, export_format, chunks)),
+                mimetype=EXPORT_MIMETYPES[export_format],
+                headers={"Content-Disposition": f"attachment; filename={export_filename}"},
+            )
+
+        except Exception as e:
+            print(f"❌ Export error: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+
+    # ----------------- Background export jobs -----------------
+    @app.route("/api/export/jobs", methods=["POST"])
+    def create_export_job():
+        """Queue an export to be rendered in the background; returns its job id."""
+        try:
+            options, error = parse_export_request(request.json)
+            if error:
+                return jsonify({"error": error}), 400
+
+            job_id = export_jobs.submit(
+                options["user_id"],
+                options["categories"],
+                options["start_date"],
+                options["end_date"],
+                options["export_format"],
+            )
+
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+        except Exception as e:
+            print(f"❌ Export job error: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/api/export/jobs/<job_id>", methods=["GET"])
+    def get_export_job(job_id):
+        """
+        Report an export job's progress. With ?download=1, serve the
+        finished file instead.
+        """
+        try:
+            user_id = request.args.get("user_id") or "anonymous"
+
+            job = export_jobs.get(job_id, user_id)
+            if not job:
+                return jsonify({"error": "Export job not found"}), 404
+
+            if request.args.get("download"):
+                if job["status"] != "done":
+                    return jsonify({"error": "Export is not ready yet", **job_status(job)}), 409
 
-                file_output = io.BytesIO()
-                file_output.write(output.encode("utf-8"))
-                file_output.seek(0)
+                path = export_jobs.artifact_path(job)
+                if not os.path.exists(path):
+                    return jsonify({"error": "Export file has expired"}), 410
 
                 return send_file(
-                    file_output,
+                    os.path.abspath(path),
                     as_attachment=True,
-                    download_name=f"health_data_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                    mimetype="application/json",
+                    download_name=f"health_data_export_{job['created_at'].strftime('%Y%m%d_%H%M%S')}.{job['format']}",
+                    mimetype=EXPORT_MIMETYPES[job["format"]],
                 )
 
-            else:
-                return jsonify({"error": "Unsupported export format"}), 400
+            return jsonify(job_status(job)), 200
 
         except Exception as e:
-            print(f"❌ Export error: {str(e)}")
+            print(f"❌ Export job status error: {str(e)}")
             return jsonify({"error": str(e)}), 500
 
 
@@ -697,58 +983,59 @@ def create_app():
             if size > MAX_FILE_SIZE:
                 return jsonify({"error": "File too large. Max 5MB"}), 400
             
-            # Generate secure filename
             filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            extension = file.filename.rsplit('.', 1)[1].lower()
             user_hash = PHIAnonymizer.hash_identifier(user_id)
-            unique_filename = f"{user_hash}_{timestamp}_{filename}"
-            
-            # Save file
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-            file.save(filepath)
-            
-            # Extract text based on file type
-            extracted_text = ""
-           
-            if filename.lower().endswith('.pdf'):
-                extracted_text = extract_pdf_text(filepath)
-            else:
-                extracted_text = extract_image_text(filepath)
-
-            # Parse prescription data
-            prescription_data = parse_prescription(extracted_text)
 
-            # Generate AI explanation
-            explanation = generate_prescription_explanation(extracted_text)
+            # Save file under the hash of its content
+            filepath, content_hash = save_content_addressed(file.stream, UPLOAD_FOLDER, extension)
 
-            # Store in MongoDB
             doc = {
                 'user_id_hash': user_hash,
-                'filename': unique_filename,
+                'filename': filename,
                 'filepath': filepath,
-                'extracted_text': extracted_text,
-                'medications': prescription_data['medications'],
-                'warnings': prescription_data['warnings'],
-                'allergies': prescription_data.get('allergies', []),  # ✅ Changed from parsed_data to prescription_data
-                'diagnoses': prescription_data.get('diagnoses', []),  # ✅ Changed from parsed_data to prescription_data
-                'ai_explanation': explanation,
+                'content_hash': content_hash,
                 'uploaded_at': datetime.now()
             }
 
+            # Same file processed before: reuse its results, only link it to this user
+            processed = find_processed(db.prescriptions, content_hash)
+            if processed:
+                doc.update({field: processed[field] for field in PRESCRIPTION_REUSABLE_FIELDS if field in processed})
+                doc.update({'status': 'completed', 'reused_from': str(processed['_id']), 'completed_at': datetime.now()})
+                result = db.prescriptions.insert_one(doc)
+
+                return jsonify({
+                    'success': True,
+                    'prescription_id': str(result.inserted_id),
+                    'status': 'completed',
+                    'stages': doc.get('stages', {}),
+                    'reused': True
+                }), 200
+
+            # Record the upload; extraction, parsing and explanation run in the background
+            doc.update({
+                'status': 'pending',
+                'stages': new_prescription_stages(),
+                'worker': current_worker(),
+                'queued_at': datetime.now(),
+            })
             result = db.prescriptions.insert_one(doc)
-            doc['_id'] = str(result.inserted_id)
+
+            try:
+                prescription_pipeline.submit(result.inserted_id, filepath, extractor_for(filepath))
+            except OCRBusy as e:
+                # Keep the stored file: other uploads of the same content may share it,
+                # and checking for them first would race with those uploads
+                db.prescriptions.delete_one({'_id': result.inserted_id})
+                return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
 
             return jsonify({
                 'success': True,
                 'prescription_id': str(result.inserted_id),
-                'extracted_text': extracted_text,
-                'medications': prescription_data['medications'],
-                'warnings': prescription_data['warnings'],
-                'allergies': prescription_data.get('allergies', []),  # ✅ Include in response
-                'diagnoses': prescription_data.get('diagnoses', []),  # ✅ Include in response
-                'explanation': explanation
-            }), 200
+                'status': 'pending',
+                'stages': doc['stages']
+            }), 202
 
         except Exception as e:
                 print(f"❌ Upload error: {str(e)}")
@@ -756,9 +1043,14 @@ def create_app():
 
             #-------------------------------------------------------------------
 
+    @app.route("/api/ocr/stats", methods=["GET"])
+    def ocr_stats():
+        """OCR pool load and recent job timings (this worker only)"""
+        return jsonify(ocr_executor.stats()), 200
+
     @app.route("/api/prescription/<prescription_id>", methods=["GET"])
     def get_prescription(prescription_id):
-        """Retrieve prescription by ID"""
+        """Retrieve prescription by ID, including per-stage processing status"""
         try:
             from bson.objectid import ObjectId
             
@@ -856,6 +1148,7 @@ def create_app():
             doc = {
                 "user_id": user_id,  # ✅ ADD
                 "date": date_str,
+                "log_date": to_log_date(dt),
                 "tookMedication": bool(data.get("tookMedication", False)),
                 "sleepHours": data.get("sleepHours"),
                 "vital_bpm": data.get("vital_bpm"),
@@ -866,12 +1159,26 @@ def create_app():
             }
 
             # ✅ FILTER update by BOTH date AND user_id
-            db.health_logs.update_one(
+            previous = db.health_logs.find_one_and_update(
                 {"date": date_str, "user_id": user_id},
                 {"$set": doc},
+                projection={"log_date": 1, **{metric: 1 for metric in ROLLUP_METRICS}},
                 upsert=True,
+                return_document=ReturnDocument.BEFORE,
             )
 
+            # Move this day's contribution in the week/month/year rollups
+            try:
+                update_rollups(db, user_id, dt, previous, doc)
+            except Exception as e:
+                print(f"⚠️ Rollup update warning: {e}")
+
+            # Invalidate this user's cached exports
+            try:
+                bump_data_version(db, user_id)
+            except Exception as e:
+                print(f"⚠️ Data version warning: {e}")
+
             return jsonify({"ok": True}), 200
 
         except Exception as e:
@@ -895,11 +1202,6 @@ def create_app():
             if not user_id:  # ✅ ADD
                 return jsonify({"error": "user_id is required"}), 400
 
-            logs = list(db.health_logs.find({"user_id": user_id}))
-
-            # Fetch from MongoDB instead of seed file
-            #logs = list(db.health_logs.find())
-
             # Validate custom date range
             if start_date and end_date:
                 start = datetime.strptime(start_date, "%Y-%m-%d")
@@ -910,71 +1212,22 @@ def create_app():
                 if start > end:
                     return jsonify({"error": "Start date must not be after end date."}), 400
 
-            if start_date or end_date:
-                filtered_logs = []
-                for log in logs:
-                    try:
-                        log_date = datetime.strptime(log["date"], "%m-%d-%Y")
-
-                        if start_date:
-                            start = datetime.strptime(start_date, "%Y-%m-%d")
-                            if log_date < start:
-                                continue
-
-                        if end_date:
-                            end = datetime.strptime(end_date, "%Y-%m-%d")
-                            if log_date > end:
-                                continue
-
-                        filtered_logs.append(log)
-                    except (ValueError, KeyError):
-                        continue
-                logs = filtered_logs
-
-            if categories:
-                filtered_logs = []
-                for log in logs:
-                    filtered_log = {"date": log["date"]}
-
-                    if "sleep" in categories and log.get("sleepHours") is not None:
-                        filtered_log["sleepHours"] = log["sleepHours"]
-
-                    if "symptoms" in categories and log.get("symptom"):
-                        filtered_log["symptom"] = log["symptom"]
-
-                    if "mood" in categories and log.get("mood") is not None:
-                        filtered_log["mood"] = log["mood"]
-
-                    if "medications" in categories and log.get("tookMedication") is not None:
-                        filtered_log["tookMedication"] = log["tookMedication"]
-
-                    if "vital_signs" in categories and log.get("vital_bpm") is not None:
-                        filtered_log["vital_bpm"] = log["vital_bpm"]
-                    
-                    if log.get("note"):
-                        filtered_log["note"] = log["note"]
-
-                    filtered_logs.append(filtered_log)
-                logs = filtered_logs
-
-            # Convert ObjectId to string and remove MongoDB-specific fields
-            health_logs = []
-            for log in logs:
-                log_copy = log.copy()
-                if "_id" in log_copy:
-                    log_copy["_id"] = str(log_copy["_id"])
-                log_copy.pop("created_at", None)
-                log_copy.pop("updated_at", None)
-                health_logs.append(log_copy)
+            # Only the first page of rows is fetched; the total comes from an index count
+            query = date_range_filter(user_id, start_date, end_date)
+            projection = export_projection(categories)
+            cursor = db.health_logs.find(query, projection).sort("log_date", 1).limit(PREVIEW_ROWS)
+            health_logs = [export_row(log, categories) for log in cursor]
 
             # If no data after filtering, return error
             if not health_logs:
                 return jsonify({"error": "No data found between the selected date range."}), 404
 
+            total_records = db.health_logs.count_documents(query)
+
             return jsonify(
                 {
-                    "preview": health_logs[:10],
-                    "total_records": len(health_logs),
+                    "preview": health_logs,
+                    "total_records": total_records,
                     "categories_included": categories if categories else ["all"],
                     "date_range": {
                         "start": start_date or "All",
@@ -1179,8 +1432,8 @@ def create_app():
 
     return app
 
-def log_conversation(db, user_hash, user_msg, bot_response, classification, phi_map, is_emergency):
-    """Log anonymized conversation to MongoDB"""
+def log_conversation(conversation_log, user_hash, user_msg, bot_response, classification, phi_map, is_emergency):
+    """Log anonymized conversation to MongoDB (through the write-behind queue)"""
     try:
         doc = {
             'user_id_hash': user_hash,
@@ -1193,7 +1446,7 @@ def log_conversation(db, user_hash, user_msg, bot_response, classification, phi_
             'timestamp': datetime.now()
         }
         
-        db.chat_conversations.insert_one(doc)
+        conversation_log.log(doc)
         print(f"✅ Logged conversation for user {user_hash[:8]}...")
         
     except Exception as e:
@@ -1201,31 +1454,13 @@ def log_conversation(db, user_hash, user_msg, bot_response, classification, phi_
 
 
 
-#helpers for the upload function
-
-def extract_pdf_text(filepath):
-    """Extract text from PDF"""
-    text = ""
-    try:
-        with open(filepath, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text()
-    except Exception as e:
-        print(f"PDF extraction error: {e}")
-    return text
+def sse_event(data, event=None):
+    """Encode one Server-Sent Event with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
 
-def extract_image_text(filepath):
-    """Extract text from image using OCR"""
-    try:
-        image = Image.open(filepath)
-        text = pytesseract.image_to_string(image)
-        return text
-    except Exception as e:
-        print(f"OCR error: {e}")
-        return ""
-
+#helpers for the upload function
 
 def parse_prescription(text):
     """Parse medications, warnings, allergies, and diagnoses from text."""
@@ -1278,12 +1513,9 @@ def parse_prescription(text):
     }
 
 
-def generate_prescription_explanation(text):
-    """Generate patient-friendly explanation using Gemini"""
-    if gemini_service is None:
-        return "Unable to generate explanation - AI service unavailable"
-    
-    prompt = f"""You are a helpful health assistant. A patient has uploaded their prescription. 
+def prescription_explanation_prompt(text):
+    """Prompt for a patient-friendly explanation of a whole prescription."""
+    return f"""You are a helpful health assistant. A patient has uploaded their prescription. 
 Explain it in simple, patient-friendly language.
 
 PRESCRIPTION TEXT:
@@ -1295,13 +1527,43 @@ Provide a brief summary (3-4 sentences) covering:
 3. Important instructions
 
 DO NOT provide medical advice or suggest changes to treatment."""
-    
+
+
+def medication_summary_prompt(med):
+    """Prompt for a short, patient-friendly summary of one medication."""
+    return f"""You are a helpful health assistant. In 1-2 simple sentences, explain what
+{med['name']} {med['dosage']} is commonly used for and one common side effect to watch for.
+
+DO NOT provide medical advice or suggest changes to treatment."""
+
+
+def generate_prescription_insights(text, medications):
+    """
+    Generate the prescription explanation plus a short summary for each of
+    the first MED_SUMMARY_LIMIT medications. The prompts are independent, so
+    they run concurrently and take about as long as the slowest one.
+    Summaries are stored on the medication dicts under "summary".
+    """
+    if gemini_service is None:
+        return "Unable to generate explanation - AI service unavailable"
+
+    summarized = medications[:MED_SUMMARY_LIMIT]
+    prompts = [prescription_explanation_prompt(text)]
+    prompts.extend(medication_summary_prompt(med) for med in summarized)
+
     try:
-        return gemini_service.chat(prompt)
+        explanation, *summaries = gemini_service.batch(prompts)
     except Exception as e:
         print(f"Gemini error: {e}")
         return "Unable to generate explanation"
 
+    for med, summary in zip(summarized, summaries):
+        # GeminiService reports failures as text instead of raising
+        if summary and not summary.startswith("Error:"):
+            med['summary'] = summary.strip()
+
+    return explanation
+
 if __name__ == "__main__":
     app = create_app()
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Re-anonymize a text field across a whole Mongo collection.
+
+Documents are streamed from the collection, scrubbed in a process pool and
+changed ones are written back with bulk updates. Running it again is a
+no-op, since PHI tokens never match a PHI pattern. Usage (from backend/):
+
+    python scripts/anonymize_collection.py prescriptions extracted_text
+    python scripts/anonymize_collection.py chat_conversations user_message --workers 4
+    python scripts/anonymize_collection.py prescriptions extracted_text --dry-run
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+# Load environment variables (.env)
+BASE_DIR = Path(__file__).resolve().parent.parent  # backend/
+env_path = BASE_DIR / ".env"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(BASE_DIR))
+from services.phi_service import BATCH_CHUNK_SIZE, anonymize_batch  # noqa: E402
+
+MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_NAME = os.getenv("MONGODB_NAME", "baymax")
+
+
+def anonymize_collection(collection, field, workers, chunk_size=BATCH_CHUNK_SIZE, write_batch=1000, dry_run=False):
+    """Scrub `field` in every document of `collection`; returns (scanned, changed)."""
+    cursor = collection.find({field: {"$type": "string"}}, {field: 1}).batch_size(chunk_size)
+
+    # Results come back in cursor order, so ids are paired up FIFO
+    ids = deque()
+
+    def texts():
+        for doc in cursor:
+            ids.append(doc["_id"])
+            yield doc[field]
+
+    scanned = changed = 0
+    ops = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for anonymized, replacements in anonymize_batch(texts(), pool, chunk_size=chunk_size):
+            doc_id = ids.popleft()
+            scanned += 1
+            if not replacements:
+                continue
+
+            changed += 1
+            ops.append(UpdateOne({"_id": doc_id}, {"$set": {field: anonymized}}))
+            if len(ops) >= write_batch:
+                if not dry_run:
+                    collection.bulk_write(ops, ordered=False)
+                ops = []
+
+    if ops and not dry_run:
+        collection.bulk_write(ops, ordered=False)
+
+    return scanned, changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("collection", help="collection to scrub, e.g. prescriptions")
+    parser.add_argument("field", help="top-level string field, e.g. extracted_text")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="texts per worker task")
+    parser.add_argument("--write-batch", type=int, default=1000, help="updates per bulk write")
+    parser.add_argument("--dry-run", action="store_true", help="count changes without writing them")
+    args = parser.parse_args()
+
+    if not MONGODB_URI:
+        raise RuntimeError("MONGODB_URI is not set in .env")
+
+    # Connect to MongoDB
+    client = MongoClient(MONGODB_URI)
+    collection = client[MONGODB_NAME][args.collection]
+
+    started = time.perf_counter()
+    scanned, changed = anonymize_collection(
+        collection,
+        args.field,
+        args.workers,
+        chunk_size=args.chunk_size,
+        write_batch=args.write_batch,
+        dry_run=args.dry_run,
+    )
+    elapsed = time.perf_counter() - started
+
+    action = "would anonymize" if args.dry_run else "anonymized"
+    rate = scanned / elapsed if elapsed else 0
+    print(
+        f"Scanned {scanned} documents in '{args.collection}', {action} {changed} "
+        f"in {elapsed:.1f}s ({rate:.0f} docs/sec)."
+    )
+
+
+if __name__ == "__main__":
+    main()
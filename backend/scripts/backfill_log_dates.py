@@ -0,0 +1,68 @@
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+# Load environment variables (.env)
+BASE_DIR = Path(__file__).resolve().parent.parent  # backend/
+env_path = BASE_DIR / ".env"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(BASE_DIR))
+from services.health_log_service import bump_data_versions, ensure_indexes, legacy_to_log_date  # noqa: E402
+
+MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_NAME = os.getenv("MONGODB_NAME", "baymax")
+
+if not MONGODB_URI:
+    raise RuntimeError("MONGODB_URI is not set in .env")
+
+# Connect to MongoDB
+client = MongoClient(MONGODB_URI)
+db = client[MONGODB_NAME]
+
+BATCH_SIZE = 1000
+
+
+def main():
+    """Add the ISO `log_date` field to health logs created before it existed."""
+    cursor = db.health_logs.find(
+        {"log_date": {"$exists": False}},
+        {"date": 1, "user_id": 1},
+    )
+
+    ops = []
+    updated = 0
+    skipped = 0
+    user_ids = set()
+
+    for doc in cursor:
+        try:
+            log_date = legacy_to_log_date(doc["date"])
+        except (KeyError, TypeError, ValueError):
+            skipped += 1
+            continue
+
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"log_date": log_date}}))
+        user_ids.add(doc.get("user_id"))
+
+        if len(ops) >= BATCH_SIZE:
+            updated += db.health_logs.bulk_write(ops, ordered=False).modified_count
+            ops = []
+
+    if ops:
+        updated += db.health_logs.bulk_write(ops, ordered=False).modified_count
+
+    ensure_indexes(db)
+
+    # Exports cached before the backfill may have missed these logs
+    bump_data_versions(db, user_ids)
+
+    print(f"Updated {updated} logs with log_date.")
+    print(f"Skipped {skipped} logs with a missing or invalid date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark PDF export rendering time and peak RSS.
+
+Each run happens in a fresh subprocess so `ru_maxrss` reflects only that
+render. Usage (from backend/):
+
+    python scripts/bench_pdf_export.py                # 1k / 10k / 50k rows
+    python scripts/bench_pdf_export.py --legacy       # also time the old single-Table renderer
+    python scripts/bench_pdf_export.py --sizes 1000 5000
+"""
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent  # backend/
+sys.path.insert(0, str(BASE_DIR))
+
+DEFAULT_SIZES = [1_000, 10_000, 50_000]
+
+
+def synthetic_logs(count):
+    """Generate `count` health logs shaped like real documents."""
+    symptoms = ["none", "headache", "fever", "nausea", "tired"]
+    for i in range(count):
+        yield {
+            "_id": f"{i:024x}",
+            "user_id": "bench-user",
+            "date": f"{(i % 12) + 1:02d}-{(i % 28) + 1:02d}-{2015 + i // 365}",
+            "tookMedication": i % 3 != 0,
+            "sleepHours": 5 + (i % 40) / 10,
+            "vital_bpm": 60 + i % 30,
+            "mood": 1 + i % 5,
+            "symptom": symptoms[i % len(symptoms)],
+            "note": "Felt fine, walked in the afternoon" if i % 4 == 0 else "",
+        }
+
+
+def render_legacy(logs, output):
+    """The previous renderer: every row in one auto-sized Table."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+
+    logs = list(logs)
+    fieldnames = list(logs[0].keys())
+    table_data = [[name.replace("_", " ").title() for name in fieldnames]]
+    for log in logs:
+        row = []
+        for field in fieldnames:
+            value = log.get(field, "N/A")
+            if value is None:
+                value = "N/A"
+            elif isinstance(value, bool):
+                value = "Yes" if value else "No"
+            row.append(str(value))
+        table_data.append(row)
+
+    table = Table(table_data)
+    table.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+                ("FONTSIZE", (0, 1), (-1, -1), 8),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+            ]
+        )
+    )
+    SimpleDocTemplate(output, pagesize=letter).build([table])
+
+
+def run_one(engine, rows):
+    """Render once in this process and print a JSON result line."""
+    from services.export_service import write_pdf
+
+    output = io.BytesIO()
+    started = time.perf_counter()
+    if engine == "legacy":
+        render_legacy(synthetic_logs(rows), output)
+    else:
+        write_pdf(output, synthetic_logs(rows), [], rows)
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss is KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "engine": engine,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(peak_mb, 1),
+        "pdf_mb": round(len(output.getvalue()) / 1024 / 1024, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--legacy", action="store_true", help="also benchmark the previous single-Table renderer")
+    parser.add_argument("--run", nargs=2, metavar=("ENGINE", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run[0], int(args.run[1]))
+        return
+
+    engines = ["chunked", "legacy"] if args.legacy else ["chunked"]
+    print(f"{'engine':<8} {'rows':>7} {'seconds':>8} {'peak RSS MB':>12} {'PDF MB':>7}")
+    for rows in args.sizes:
+        for engine in engines:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--run", engine, str(rows)],
+                capture_output=True,
+                text=True,
+                cwd=BASE_DIR,
+            )
+            if proc.returncode != 0:
+                print(f"{engine:<8} {rows:>7} failed: {proc.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(
+                f"{engine:<8} {rows:>7} {result['seconds']:>8} "
+                f"{result['peak_rss_mb']:>12} {result['pdf_mb']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
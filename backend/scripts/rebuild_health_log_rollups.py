@@ -0,0 +1,39 @@
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+# Load environment variables (.env)
+BASE_DIR = Path(__file__).resolve().parent.parent  # backend/
+env_path = BASE_DIR / ".env"
+load_dotenv(env_path)
+
+sys.path.insert(0, str(BASE_DIR))
+from services.health_log_service import bump_data_versions, ensure_indexes, rebuild_rollups  # noqa: E402
+
+MONGODB_URI = os.getenv("MONGODB_URI")
+MONGODB_NAME = os.getenv("MONGODB_NAME", "baymax")
+
+if not MONGODB_URI:
+    raise RuntimeError("MONGODB_URI is not set in .env")
+
+# Connect to MongoDB
+client = MongoClient(MONGODB_URI)
+db = client[MONGODB_NAME]
+
+
+def main():
+    """Backfill `health_log_rollups` from every log in `health_logs`."""
+    ensure_indexes(db)
+    written = rebuild_rollups(db)
+    print(f"Rebuilt {written} rollup buckets in 'health_log_rollups'.")
+
+    # Logs may have changed behind the app's back; drop every cached export
+    bumped = bump_data_versions(db)
+    print(f"Bumped the data version of {bumped} users.")
+
+
+if __name__ == "__main__":
+    main()
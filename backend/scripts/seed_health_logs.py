@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 from datetime import datetime
 from pathlib import Path
@@ -11,6 +12,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent  # backend/
 env_path = BASE_DIR / ".env"
 load_dotenv(env_path)
 
+sys.path.insert(0, str(BASE_DIR))
+from services.health_log_service import bump_data_versions, legacy_to_log_date  # noqa: E402
+
 MONGODB_URI = os.getenv("MONGODB_URI")
 MONGODB_NAME = os.getenv("MONGODB_NAME", "baymax")
 
@@ -35,14 +39,18 @@ def main():
     with open(seed_file, "r", encoding="utf-8") as f:
         docs = json.load(f)
 
-    # Add created_at timestamp to each document
+    # Add created_at timestamp and the indexed ISO date to each document
     for doc in docs:
         doc["created_at"] = datetime.utcnow()
+        doc["log_date"] = legacy_to_log_date(doc["date"])
 
     # Insert documents into MongoDB collection
     result = db.health_logs.insert_many(docs)
 
     print(f"Inserted {len(result.inserted_ids)} documents into 'health_logs'.")
+
+    # Cached exports for these users are now out of date
+    bump_data_versions(db, [doc.get("user_id") for doc in docs])
     print("   Inserted IDs:")
     print([str(_id) for _id in result.inserted_ids])
 
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+# Rough characters-per-token ratio for English text (no tokenizer call needed)
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = """Summarize this conversation between a user and Baymax, a health information assistant.
+Keep the health topics, symptoms and questions that were discussed; leave out greetings and
+any personal identifiers. Answer with at most {words} words of plain text.
+
+{previous}New exchanges:
+{turns}
+"""
+
+
+def estimate_tokens(text):
+    """Approximate token count of `text`."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_turn(turn):
+    """One logged exchange as prompt lines."""
+    return f"User: {turn.get('user_message', '')}\nBaymax: {turn.get('bot_response', '')}"
+
+
+def select_turns(history, token_budget):
+    """
+    Split `history` (newest first) into the turns that fit in `token_budget`
+    and the older turns that don't. Returns (kept, dropped), both newest first.
+    """
+    used = 0
+    for index, turn in enumerate(history):
+        used += estimate_tokens(format_turn(turn))
+        if used > token_budget:
+            return history[:index], history[index:]
+    return history, []
+
+
+class ChatHistoryManager:
+    """
+    Build the history section of the chat prompt within a token budget.
+
+    Recent turns are included verbatim up to `token_budget`. Turns that fall
+    out of the window are folded into a rolling summary per `user_id_hash`
+    (in `chat_summaries`), refreshed with one model call once
+    `summary_every` uncovered turns have piled up.
+    """
+
+    def __init__(self, db, generate, token_budget=1200, summary_every=10, summary_words=120):
+        self.db = db
+        self.generate = generate
+        self.token_budget = token_budget
+        self.summary_every = summary_every
+        self.summary_words = summary_words
+
+    def ensure_indexes(self, expire_after_seconds):
+        """Expire summaries along with the conversations they describe."""
+        self.db.chat_summaries.create_index("updated_at", expireAfterSeconds=expire_after_seconds)
+
+    def history_text(self, user_hash, history):
+        """Prompt text for `history` (logged turns, newest first)."""
+        kept, dropped = select_turns(history, self.token_budget)
+
+        summary_doc = self.db.chat_summaries.find_one({"_id": user_hash})
+        summary = self._refresh_summary(user_hash, summary_doc, dropped)
+
+        sections = []
+        if summary:
+            sections.append(f"Summary of earlier conversation: {summary}")
+        sections.extend(format_turn(turn) for turn in reversed(kept))  # oldest → newest
+        return "\n".join(sections)
+
+    def _refresh_summary(self, user_hash, summary_doc, dropped):
+        summary = summary_doc.get("summary", "") if summary_doc else ""
+        covered_until = summary_doc.get("covered_until") if summary_doc else None
+
+        pending = [
+            turn for turn in dropped
+            if covered_until is None or (turn.get("timestamp") and turn["timestamp"] > covered_until)
+        ]
+        if len(pending) < self.summary_every:
+            return summary
+
+        pending.reverse()  # oldest → newest
+        previous = f"Summary so far:\n{summary}\n\n" if summary else ""
+        prompt = SUMMARY_PROMPT.format(
+            words=self.summary_words,
+            previous=previous,
+            turns="\n".join(format_turn(turn) for turn in pending),
+        )
+
+        try:
+            new_summary = (self.generate(prompt) or "").strip()
+        except Exception as e:
+            print(f"⚠️ History summary warning: {e}")
+            return summary
+
+        # GeminiService reports failures as text instead of raising
+        if not new_summary or new_summary.startswith("Error:"):
+            return summary
+
+        # Keep the summary bounded even if the model ignores the word limit
+        new_summary = " ".join(new_summary.split()[: self.summary_words])
+
+        self.db.chat_summaries.update_one(
+            {"_id": user_hash},
+            {
+                "$set": {
+                    "summary": new_summary,
+                    "covered_until": pending[-1].get("timestamp"),
+                    "updated_at": datetime.now(),
+                }
+            },
+            upsert=True,
+        )
+        return new_summary
@@ -0,0 +1,182 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from bson import ObjectId
+
+# Durability modes for ConversationLogWriter
+DURABILITY_MODES = ("sync", "async")
+
+_STOP = object()
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ConversationLogWriter:
+    """
+    Write-behind logger for `chat_conversations`.
+
+    With durability "async", documents are queued in memory and a background
+    thread writes them with `insert_many` once `batch_size` are waiting or
+    `flush_interval` seconds have passed, so requests never wait on Mongo.
+    Queued documents are flushed on normal shutdown but lost if the process
+    is killed. Durability "sync" inserts each document in the caller.
+
+    Until a document is written, `pending()` returns it so the same worker
+    still sees the user's latest turns when building history.
+    """
+
+    def __init__(self, collection, durability="async", batch_size=100, flush_interval=0.5, max_queue=10000):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.collection = collection
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def log(self, doc):
+        """Record one conversation document."""
+        # Assigned up front so a queued copy and its stored copy can be matched
+        doc.setdefault("_id", ObjectId())
+
+        if self.durability == "sync":
+            self.collection.insert_one(doc)
+            return
+
+        self._ensure_thread()
+        with self._lock:
+            self._pending.setdefault(doc["user_id_hash"], deque()).append(doc)
+        try:
+            self._queue.put_nowait(doc)
+        except queue.Full:
+            # Writer can't keep up: fall back to a direct insert (backpressure)
+            self._forget([doc])
+            self.collection.insert_one(doc)
+
+    def pending(self, user_hash):
+        """Queued but not yet written documents for a user, newest first."""
+        with self._lock:
+            return list(reversed(self._pending.get(user_hash, ())))
+
+    def recent(self, user_hash, limit, fields):
+        """A user's last `limit` turns, newest first, including unwritten ones."""
+        pending = self.pending(user_hash)
+        queued_ids = {doc["_id"] for doc in pending}
+
+        projection = {field: 1 for field in fields}
+        stored = self.collection.find({"user_id_hash": user_hash}, projection).sort("timestamp", -1).limit(limit)
+
+        # A document written since pending() was read shows up in both
+        history = pending + [doc for doc in stored if doc["_id"] not in queued_ids]
+        return history[:limit]
+
+    def flush(self, timeout=None):
+        """Block until everything logged so far has been written."""
+        if self.durability == "sync" or not self._thread_alive():
+            return
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        marker.done.wait(timeout)
+
+    def close(self, timeout=5):
+        """Write what is queued and stop the background thread."""
+        if not self._thread_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _thread_alive(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_thread(self):
+        # Started lazily (and again after a fork) so pre-forking servers get
+        # one writer per worker process
+        if self._thread_alive():
+            return
+        with self._lock:
+            if self._thread_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            markers = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+
+            # Collect until the batch is full, the interval ends, or a
+            # flush/stop request arrives
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, _FlushMarker):
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+            for marker in markers:
+                marker.done.set()
+
+            if stop:
+                # Drain anything logged after the stop request
+                leftover = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _FlushMarker):
+                        item.done.set()
+                    elif item is not _STOP:
+                        leftover.append(item)
+                self._write(leftover)
+                return
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            print(f"❌ Failed to log {len(batch)} conversations: {str(e)}")
+        finally:
+            self._forget(batch)
+
+    def _forget(self, docs):
+        with self._lock:
+            for doc in docs:
+                pending = self._pending.get(doc["user_id_hash"])
+                if not pending:
+                    continue
+                try:
+                    pending.remove(doc)
+                except ValueError:
+                    pass
+                if not pending:
+                    del self._pending[doc["user_id_hash"]]
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import uuid
+
+
+class ExportCache:
+    """
+    On-disk cache of rendered exports, keyed by a hash of the export options
+    and the user's data version. Least recently used files are evicted once
+    the folder grows past `max_bytes`.
+    """
+
+    def __init__(self, folder, max_bytes=256 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(user_id, start_date, end_date, categories, export_format, data_version):
+        """SHA-256 of everything that determines an export's contents."""
+        payload = json.dumps(
+            [user_id, start_date, end_date, sorted(categories or []), export_format, data_version],
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key, export_format):
+        return os.path.join(self.folder, f"{key}.{export_format}")
+
+    def get(self, key, export_format):
+        """Return the cached file's path (marking it recently used), or None."""
+        path = self.path(key, export_format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store_stream(self, key, export_format, chunks):
+        """
+        Pass `chunks` through while writing them to the cache. The entry is
+        only kept if the stream runs to completion.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        final = self.path(key, export_format)
+        tmp = f"{final}.{uuid.uuid4().hex}.part"
+
+        completed = False
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp, final)
+            completed = True
+            self._evict()
+        finally:
+            if not completed and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def store_file(self, key, export_format, write):
+        """
+        Cache an export that `write(path)` renders straight to disk and
+        return the cached file's path. Nothing is kept if `write` fails.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        final = self.path(key, export_format)
+        tmp = f"{final}.{uuid.uuid4().hex}.part"
+        try:
+            write(tmp)
+            os.replace(tmp, final)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._evict(keep=final)
+        return final
+
+    def store_bytes(self, key, export_format, data):
+        """Cache an export rendered in memory."""
+        for _ in self.store_stream(key, export_format, [data]):
+            pass
+
+    def _evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits `max_bytes`,
+        never the entry at `keep` (one about to be served).
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".part") or entry.path == keep:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
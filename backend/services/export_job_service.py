@@ -0,0 +1,170 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.export_service import export_projection, write_export
+from services.health_log_service import date_range_filter
+from services.worker_service import current_worker, orphaned_filter
+
+# How often (in rows) a running job reports progress
+PROGRESS_EVERY = 500
+
+# Job statuses that a live worker still has to finish
+UNFINISHED_STATUSES = ("queued", "running")
+
+
+class ExportJobManager:
+    """
+    Render exports in a background thread pool.
+
+    Job state lives in the `export_jobs` collection so any gunicorn worker
+    can report on it; finished files are written to `folder` on local disk.
+    Each job records the worker process running it, so jobs left behind
+    when a worker exits can be marked failed by `fail_orphaned`.
+    """
+
+    def __init__(self, db, folder, max_workers=2, retention_seconds=24 * 3600, stale_seconds=3600):
+        self.db = db
+        self.folder = folder
+        self.retention_seconds = retention_seconds
+        self.stale_seconds = stale_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export-job")
+
+    def ensure_indexes(self):
+        """Expire job records after the retention window."""
+        self.db.export_jobs.create_index("created_at", expireAfterSeconds=self.retention_seconds)
+
+    def submit(self, user_id, categories, start_date, end_date, export_format):
+        """Queue an export and return its job id right away."""
+        job_id = uuid.uuid4().hex
+        self.db.export_jobs.insert_one({
+            "_id": job_id,
+            "user_id": user_id,
+            "categories": categories,
+            "start_date": start_date,
+            "end_date": end_date,
+            "format": export_format,
+            "status": "queued",
+            "worker": current_worker(),
+            "processed_records": 0,
+            "total_records": None,
+            "created_at": datetime.now(),
+        })
+
+        self._remove_expired_files()
+        self.executor.submit(self._run, job_id)
+        return job_id
+
+    def fail_orphaned(self):
+        """
+        Mark jobs that no worker will finish as failed: those left queued or
+        running by a worker process that exited, or older than
+        `stale_seconds`. Returns how many were marked.
+        """
+        query = orphaned_filter(self.db.export_jobs, UNFINISHED_STATUSES, "created_at", self.stale_seconds)
+        return self._fail_all(query, "Export was interrupted, please start it again")
+
+    def shutdown(self):
+        """Stop taking jobs; queued ones are cancelled and marked failed."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self._fail_all(
+            {"status": "queued", "worker": current_worker()},
+            "Export was cancelled by a server restart, please start it again",
+        )
+
+    def get(self, job_id, user_id):
+        """Return the job document, or None if it doesn't belong to `user_id`."""
+        return self.db.export_jobs.find_one({"_id": job_id, "user_id": user_id})
+
+    def artifact_path(self, job):
+        return os.path.join(self.folder, f"{job['_id']}.{job['format']}")
+
+    def _run(self, job_id):
+        job = self.db.export_jobs.find_one({"_id": job_id})
+        path = self.artifact_path(job)
+        started = time.perf_counter()
+
+        try:
+            query = date_range_filter(job["user_id"], job["start_date"], job["end_date"])
+            total = self.db.health_logs.count_documents(query)
+            self._update(job_id, status="running", total_records=total, started_at=datetime.now())
+
+            os.makedirs(self.folder, exist_ok=True)
+            cursor = self.db.health_logs.find(query, export_projection(job["categories"]))
+            logs = self._track(job_id, cursor.sort("log_date", 1))
+
+            # Write to a temp name so a half-written file is never served
+            write_export(
+                path + ".part",
+                job["format"],
+                logs,
+                job["categories"],
+                total,
+                job["start_date"],
+                job["end_date"],
+            )
+            os.replace(path + ".part", path)
+
+            self._update(
+                job_id,
+                status="done",
+                processed_records=total,
+                finished_at=datetime.now(),
+                render_seconds=round(time.perf_counter() - started, 3),
+            )
+            print(f"✅ Export job {job_id[:8]} finished ({total} records)")
+
+        except Exception as e:
+            print(f"❌ Export job {job_id[:8]} failed: {e}")
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now())
+
+    def _track(self, job_id, logs):
+        """Pass logs through, recording progress every PROGRESS_EVERY rows."""
+        for count, log in enumerate(logs, 1):
+            if count % PROGRESS_EVERY == 0:
+                self._update(job_id, processed_records=count)
+            yield log
+
+    def _fail_all(self, query, error):
+        result = self.db.export_jobs.update_many(
+            query,
+            {"$set": {"status": "failed", "error": error, "finished_at": datetime.now()}},
+        )
+        return result.modified_count
+
+    def _update(self, job_id, **fields):
+        self.db.export_jobs.update_one({"_id": job_id}, {"$set": fields})
+
+    def _remove_expired_files(self):
+        """Delete rendered files older than the retention window."""
+        if not os.path.isdir(self.folder):
+            return
+        cutoff = time.time() - self.retention_seconds
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+
+def job_status(job):
+    """Public view of a job document for the status endpoint."""
+    total = job.get("total_records")
+    processed = job.get("processed_records", 0)
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "format": job["format"],
+        "processed_records": processed,
+        "total_records": total,
+        "progress": round(processed / total, 3) if total else (1.0 if job["status"] == "done" else 0.0),
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+    }
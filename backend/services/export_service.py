@@ -0,0 +1,389 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import LongTable, Paragraph, TableStyle
+
+# Response mimetype per export format
+MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "pdf": "application/pdf",
+}
+
+# Export category -> health log field
+CATEGORY_FIELDS = {
+    "sleep": "sleepHours",
+    "symptoms": "symptom",
+    "mood": "mood",
+    "medications": "tookMedication",
+    "vital_signs": "vital_bpm",
+}
+
+# Columns written when no categories are selected
+ALL_COLUMNS = ["_id", "user_id", "date", "tookMedication", "sleepHours", "vital_bpm", "mood", "symptom", "note"]
+
+# Internal fields never included in an export
+INTERNAL_FIELDS = ("created_at", "updated_at", "log_date")
+
+
+def export_columns(categories):
+    """Fixed column order for an export with the given categories."""
+    if not categories:
+        return list(ALL_COLUMNS)
+    fields = [field for category, field in CATEGORY_FIELDS.items() if category in categories]
+    return ["date"] + fields + ["note"]
+
+
+def export_projection(categories):
+    """
+    Mongo projection fetching only the fields `export_row` reads for these
+    categories, or None (whole documents) when no categories are selected.
+    """
+    if not categories:
+        return None
+    projection = {"_id": 0, "date": 1, "note": 1}
+    for category, field in CATEGORY_FIELDS.items():
+        if category in categories:
+            projection[field] = 1
+    return projection
+
+
+def export_row(log, categories):
+    """
+    Turn one health log document into an export record: keep only the
+    selected categories (plus date and note) and drop Mongo-internal fields.
+    """
+    if categories:
+        row = {"date": log["date"]}
+
+        # Blank values (no reading, empty symptom) are left out
+        for category, field in CATEGORY_FIELDS.items():
+            if category in categories and log.get(field) not in (None, ""):
+                row[field] = log[field]
+
+        # Include note if it exists
+        if log.get("note"):
+            row["note"] = log["note"]
+
+        return row
+
+    row = dict(log)
+    if "_id" in row:
+        row["_id"] = str(row["_id"])
+    for field in INTERNAL_FIELDS:
+        row.pop(field, None)
+    return row
+
+
+def iter_csv(logs, categories):
+    """
+    Yield a CSV export as UTF-8 chunks: the header first, then one chunk
+    per log. Only a single row is ever buffered.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=export_columns(categories), extrasaction="ignore")
+
+    def drain():
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    writer.writeheader()
+    yield drain()
+
+    for log in logs:
+        writer.writerow(export_row(log, categories))
+        yield drain()
+
+
+def iter_ndjson(logs, categories):
+    """Yield newline-delimited JSON, one encoded record per log."""
+    for log in logs:
+        yield (json.dumps(export_row(log, categories), default=str) + "\n").encode("utf-8")
+
+
+def export_info(categories, start_date, end_date, total_records):
+    """The `export_info` header written at the top of JSON exports."""
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "date_range": {
+            "start": start_date or "All",
+            "end": end_date or "All",
+        },
+        "categories": categories if categories else "All",
+        "total_records": total_records,
+    }
+
+
+def iter_json(logs, categories, export_info):
+    """
+    Yield the `{"export_info": ..., "data": [...]}` envelope incrementally,
+    serializing one record at a time instead of the whole export.
+    """
+    info = json.dumps(export_info, indent=2, default=str).replace("\n", "\n  ")
+    yield f'{{\n  "export_info": {info},\n  "data": ['.encode("utf-8")
+
+    separator = "\n    "
+    for log in logs:
+        yield (separator + json.dumps(export_row(log, categories), default=str)).encode("utf-8")
+        separator = ",\n    "
+
+    yield b"\n  ]\n}\n"
+
+
+GENERATED_AT_PATTERN = re.compile(rb'"generated_at": "[^"]*"')
+
+
+def restamp_json(path, generated_at, chunk_size=64 * 1024):
+    """
+    Yield a JSON export saved at `path` with its `export_info.generated_at`
+    replaced by `generated_at`, so a cached export reports when it was served.
+    """
+    stamp = b'"generated_at": ' + json.dumps(generated_at.isoformat()).encode("utf-8")
+    with open(path, "rb") as f:
+        # export_info opens the file, so the stamp is in the first chunk
+        yield GENERATED_AT_PATTERN.sub(lambda _: stamp, f.read(chunk_size), count=1)
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield chunk
+
+
+# ----------------- PDF export -----------------
+
+PDF_MARGIN = inch
+PDF_FONT_SIZE = 8
+PDF_HEADER_HEIGHT = 24
+PDF_ROW_HEIGHT = 14
+PDF_CELL_PADDING = 6
+
+# Ends a cell cut short because its text can't fit on one page
+PDF_CLIPPED_MARKER = " [...]"
+
+# Exports with more columns than this are laid out in landscape
+PDF_PORTRAIT_MAX_COLUMNS = 6
+
+# Relative column widths; unlisted columns get 1
+PDF_COLUMN_WEIGHTS = {"_id": 2.6, "user_id": 2.6, "date": 1.4, "mood": 0.8, "symptom": 1.4, "note": 3}
+
+# Readable header labels; other columns fall back to Title Case
+PDF_COLUMN_LABELS = {
+    "_id": "ID",
+    "user_id": "User ID",
+    "tookMedication": "Took Medication",
+    "sleepHours": "Sleep Hours",
+    "vital_bpm": "Vital BPM",
+}
+
+# Header and body styles shared by every page's table
+PDF_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), PDF_FONT_SIZE),
+        ("LEFTPADDING", (0, 0), (-1, -1), PDF_CELL_PADDING / 2),
+        ("RIGHTPADDING", (0, 0), (-1, -1), PDF_CELL_PADDING / 2),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+    ]
+)
+
+PDF_HEADER_STYLE = ParagraphStyle(
+    "ExportHeader",
+    fontName="Helvetica-Bold",
+    fontSize=PDF_FONT_SIZE,
+    leading=PDF_FONT_SIZE + 1,
+    textColor=colors.whitesmoke,
+    alignment=1,
+)
+
+# Body cells too long for one line wrap inside their column
+PDF_CELL_STYLE = ParagraphStyle(
+    "ExportCell",
+    fontName="Helvetica",
+    fontSize=PDF_FONT_SIZE,
+    leading=PDF_FONT_SIZE + 2,
+    alignment=1,
+)
+
+
+def _pdf_column_widths(columns, page_width):
+    """Split the printable width across columns by weight."""
+    available = page_width - 2 * PDF_MARGIN
+    weights = [PDF_COLUMN_WEIGHTS.get(column, 1) for column in columns]
+    total = sum(weights)
+    return [available * weight / total for weight in weights]
+
+
+def _pdf_cell(value, max_width, max_height=None):
+    """
+    Format one cell: plain text when it fits on one line, otherwise a
+    Paragraph wrapped to the column. Text that would need more than
+    `max_height` is cut short and ends with PDF_CLIPPED_MARKER. Returns
+    (cell, row height it needs).
+    """
+    if value is None:
+        value = "N/A"
+    elif isinstance(value, bool):
+        value = "Yes" if value else "No"
+    text = str(value)
+
+    # No Helvetica glyph is wider than ~1.02em, so short text always fits
+    if len(text) * PDF_FONT_SIZE * 1.02 <= max_width:
+        return text, PDF_ROW_HEIGHT
+    if stringWidth(text, "Helvetica", PDF_FONT_SIZE) <= max_width:
+        return text, PDF_ROW_HEIGHT
+
+    paragraph = Paragraph(escape(text), PDF_CELL_STYLE)
+    _, height = paragraph.wrap(max_width, PDF_ROW_HEIGHT)
+    if max_height and height + PDF_CELL_PADDING > max_height:
+        paragraph, height = _clipped_paragraph(text, max_width, max_height - PDF_CELL_PADDING)
+    return paragraph, max(height + PDF_CELL_PADDING, PDF_ROW_HEIGHT)
+
+
+def _clipped_paragraph(text, max_width, max_height):
+    """Longest prefix of `text`, plus the clip marker, that wraps within `max_height`."""
+    def wrapped(length):
+        paragraph = Paragraph(escape(text[:length].rstrip()) + PDF_CLIPPED_MARKER, PDF_CELL_STYLE)
+        return paragraph, paragraph.wrap(max_width, max_height)[1]
+
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if wrapped(middle)[1] <= max_height:
+            low = middle
+        else:
+            high = middle - 1
+    return wrapped(low)
+
+
+def _draw(canv, flowable, y, page_width):
+    """Draw a flowable at the left margin below `y`; return the new `y`."""
+    y -= flowable.getSpaceBefore()
+    _, height = flowable.wrapOn(canv, page_width - 2 * PDF_MARGIN, y - PDF_MARGIN)
+    flowable.drawOn(canv, PDF_MARGIN, y - height)
+    return y - height - flowable.getSpaceAfter()
+
+
+def write_pdf(output, logs, categories, total_records, start_date=None, end_date=None):
+    """
+    Render a PDF export of `logs` into `output` (a path or binary file).
+
+    Rows are drawn page by page: each page gets its own LongTable with the
+    header row, precomputed column widths and row heights measured as the
+    rows are built, so only one page of rows is in memory and reportlab
+    never splits a table. Long values wrap within their cell.
+    """
+    columns = export_columns(categories)
+    page_size = landscape(letter) if len(columns) > PDF_PORTRAIT_MAX_COLUMNS else letter
+    page_width, page_height = page_size
+
+    canv = canvas.Canvas(output, pagesize=page_size)
+    styles = getSampleStyleSheet()
+    top = page_height - PDF_MARGIN
+
+    title_style = ParagraphStyle(
+        "CustomTitle",
+        parent=styles["Heading1"],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,
+    )
+    info_style = styles["Normal"]
+
+    y = _draw(canv, Paragraph("Baymax Health Data Export", title_style), top, page_width)
+    for line in (
+        f"<b>Generated:</b> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}",
+        f"<b>Date Range:</b> {start_date or 'All'} to {end_date or 'All'}",
+        f"<b>Categories:</b> {', '.join(categories) if categories else 'All'}",
+        f"<b>Total Records:</b> {total_records}",
+    ):
+        y = _draw(canv, Paragraph(line, info_style), y, page_width)
+    y -= 20
+
+    widths = _pdf_column_widths(columns, page_width)
+    text_widths = [width - PDF_CELL_PADDING for width in widths]
+    header = [
+        Paragraph(PDF_COLUMN_LABELS.get(name, name.replace("_", " ").title()), PDF_HEADER_STYLE)
+        for name in columns
+    ]
+
+    def space_below(y):
+        return y - PDF_MARGIN - PDF_HEADER_HEIGHT
+
+    def flush(rows, heights, y):
+        table = LongTable(
+            [header] + rows,
+            colWidths=widths,
+            rowHeights=[PDF_HEADER_HEIGHT] + heights,
+            repeatRows=1,
+            style=PDF_TABLE_STYLE,
+        )
+        _draw(canv, table, y, page_width)
+        canv.showPage()
+
+    # No row may be taller than a page without the title block
+    max_row_height = space_below(top)
+
+    rows, heights = [], []
+    used, space = 0, space_below(y)
+    drew_rows = False
+
+    for log in logs:
+        record = export_row(log, categories)
+        cells = [
+            _pdf_cell(record.get(column, "N/A"), width, max_row_height)
+            for column, width in zip(columns, text_widths)
+        ]
+        row_height = max(height for _, height in cells)
+        if used + row_height > space and (rows or y != top):
+            if rows:
+                flush(rows, heights, y)
+                drew_rows = True
+            else:
+                # Not even one row fits below the title block
+                canv.showPage()
+            rows, heights = [], []
+            y = top
+            used, space = 0, space_below(y)
+        rows.append([cell for cell, _ in cells])
+        heights.append(row_height)
+        used += row_height
+
+    if rows:
+        flush(rows, heights, y)
+    elif not drew_rows:
+        _draw(canv, Paragraph("No data found for the selected criteria.", styles["Normal"]), y, page_width)
+        canv.showPage()
+
+    canv.save()
+
+
+def write_export(path, export_format, logs, categories, total_records, start_date=None, end_date=None):
+    """Render an export of any supported format to a file on disk."""
+    if export_format == "pdf":
+        write_pdf(path, logs, categories, total_records, start_date, end_date)
+        return
+
+    if export_format == "csv":
+        chunks = iter_csv(logs, categories)
+    elif export_format == "ndjson":
+        chunks = iter_ndjson(logs, categories)
+    else:
+        chunks = iter_json(logs, categories, export_info(categories, start_date, end_date, total_records))
+
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
@@ -1,5 +1,361 @@
+import asyncio
 import google.generativeai as genai
 import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from google.api_core import exceptions as google_exceptions
+
+
+class GeminiUnavailable(Exception):
+    """The call was not attempted: queue full, wait deadline passed or circuit open."""
+
+
+class GeminiTimeout(Exception):
+    """The model did not answer within the per-call timeout."""
+
+
+# Upstream errors worth retrying (and counted against the circuit breaker)
+TRANSIENT_ERRORS = (
+    GeminiTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+)
+
+
+class GeminiLimiter:
+    """
+    Guard around model calls.
+
+    At most `max_concurrency` calls run at once; up to `max_queue` more wait
+    up to `queue_timeout` seconds for a slot and anything beyond that is
+    rejected straight away. Each call gets `timeout` seconds, and transient
+    errors are retried with jittered exponential backoff. After
+    `failure_threshold` consecutive failures the circuit opens and calls fail
+    fast for `cooldown` seconds; then one trial call decides whether it
+    closes again.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=4,
+        max_queue=16,
+        queue_timeout=5.0,
+        timeout=30.0,
+        retries=2,
+        backoff=0.5,
+        failure_threshold=5,
+        cooldown=30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # A timed-out call keeps running here and holds its slot until it ends
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self._lock = threading.Lock()
+
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._consecutive_failures = 0
+
+        self._waiting = 0
+        self._in_flight = 0
+        self._counts = dict.fromkeys(
+            [
+                "calls",
+                "failures",
+                "timeouts",
+                "retries",
+                "rejected_queue_full",
+                "rejected_deadline",
+                "rejected_circuit_open",
+            ],
+            0,
+        )
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")),
+            max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "16")),
+            queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", "5")),
+            timeout=float(os.getenv("GEMINI_TIMEOUT", "30")),
+            retries=int(os.getenv("GEMINI_RETRIES", "2")),
+            failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+            cooldown=float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30")),
+        )
+
+    def call(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` with the slot limit, timeout, retries and breaker."""
+        for attempt in range(self.retries + 1):
+            try:
+                return self._call_once(fn, args, kwargs)
+            except TRANSIENT_ERRORS:
+                if attempt == self.retries:
+                    raise
+                self._count("retries")
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def acall(self, coro_fn, *args, **kwargs):
+        """`call` for coroutine functions; awaits `coro_fn(*args, **kwargs)`."""
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._acall_once(coro_fn, args, kwargs)
+            except TRANSIENT_ERRORS:
+                if attempt == self.retries:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def stream(self, fn, *args, **kwargs):
+        """
+        Yield the items of `fn(*args, **kwargs)` (e.g. a streamed response)
+        while holding one slot. The whole stream gets `timeout` seconds: past
+        that no more items are read and GeminiTimeout is raised. Items are
+        read in a helper thread; once the caller stops (timeout, error or
+        closing early) that thread closes the upstream iterator at its next
+        item. Like a timed-out call, the slot is held until it has exited.
+        """
+        self._acquire()
+        deadline = time.monotonic() + self.timeout
+        items = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                upstream = iter(fn(*args, **kwargs))
+                for item in upstream:
+                    if stop.is_set():
+                        close = getattr(upstream, "close", None)
+                        if close:
+                            close()
+                        return
+                    items.put((True, item))
+                items.put((False, None))
+            except Exception as e:
+                items.put((False, e))
+            finally:
+                self._release()
+
+        try:
+            threading.Thread(target=pump, name="gemini-stream", daemon=True).start()
+        except Exception:
+            self._release()
+            raise
+
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    more, item = items.get(timeout=remaining)
+                except queue.Empty:
+                    self._count("timeouts")
+                    raise GeminiTimeout(f"Gemini did not finish streaming within {self.timeout:g}s")
+                if not more:
+                    if item is not None:
+                        raise item
+                    break
+                yield item
+        except TRANSIENT_ERRORS:
+            self._record_failure()
+            raise
+        except GeneratorExit:
+            # Closed by the caller (e.g. the client went away); upstream was fine
+            self._record_success()
+            raise
+        except Exception:
+            self._record_success()
+            raise
+        else:
+            self._record_success()
+        finally:
+            stop.set()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "consecutive_failures": self._consecutive_failures,
+                **self._counts,
+            }
+
+    def _call_once(self, fn, args, kwargs):
+        self._acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self._count("timeouts")
+            self._record_failure()
+            raise GeminiTimeout(f"Gemini did not respond within {self.timeout:g}s")
+        except TRANSIENT_ERRORS:
+            self._record_failure()
+            raise
+        except Exception:
+            # Bad requests and the like: the upstream itself is healthy
+            self._record_success()
+            raise
+
+        self._record_success()
+        return result
+
+    async def _acall_once(self, coro_fn, args, kwargs):
+        # Waiting for a slot blocks, so it happens off the event loop
+        acquiring = asyncio.get_running_loop().run_in_executor(None, self._acquire)
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The wait goes on in its thread; hand the slot back if it gets one
+            acquiring.add_done_callback(self._abandon_acquired)
+            raise
+
+        try:
+            result = await asyncio.wait_for(coro_fn(*args, **kwargs), self.timeout)
+        except asyncio.CancelledError:
+            self._abandon_trial()
+            raise
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            self._record_failure()
+            raise GeminiTimeout(f"Gemini did not respond within {self.timeout:g}s")
+        except TRANSIENT_ERRORS:
+            self._record_failure()
+            raise
+        except Exception:
+            self._record_success()
+            raise
+        finally:
+            self._release()
+
+        self._record_success()
+        return result
+
+    def _acquire(self):
+        with self._lock:
+            self._counts["calls"] += 1
+
+            if self._state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    self._counts["rejected_circuit_open"] += 1
+                    raise GeminiUnavailable("Gemini is temporarily unavailable, please try again shortly")
+                self._state = "half_open"
+
+            if self._state == "half_open":
+                # Only the trial call goes through until it succeeds or fails
+                if self._trial_in_flight:
+                    self._counts["rejected_circuit_open"] += 1
+                    raise GeminiUnavailable("Gemini is temporarily unavailable, please try again shortly")
+                self._trial_in_flight = True
+
+            if self._slots.acquire(blocking=False):
+                self._in_flight += 1
+                return
+
+            if self._waiting >= self.max_queue:
+                self._trial_in_flight = False
+                self._counts["rejected_queue_full"] += 1
+                raise GeminiUnavailable("Gemini is busy, please try again shortly")
+            self._waiting += 1
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._trial_in_flight = False
+                self._counts["rejected_deadline"] += 1
+                raise GeminiUnavailable("Gemini is busy, please try again shortly")
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _abandon_acquired(self, acquiring):
+        """Done callback for a slot wait whose caller was cancelled."""
+        if not acquiring.cancelled() and acquiring.exception() is None:
+            self._abandon_trial()
+            self._release()
+
+    def _abandon_trial(self):
+        # A cancelled call says nothing about upstream health; if it was the
+        # half-open trial, let the next call try instead
+        with self._lock:
+            if self._state == "half_open":
+                self._trial_in_flight = False
+
+    def _record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._state = "closed"
+            self._trial_in_flight = False
+
+    def _record_failure(self):
+        with self._lock:
+            self._counts["failures"] += 1
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+
+class EventLoopThread:
+    """
+    One asyncio event loop running in a daemon thread, shared by every
+    caller. Started lazily (and again after a fork) so each worker process
+    gets its own.
+    """
+
+    def __init__(self, name="gemini-loop"):
+        self.name = name
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def run(self, coro, timeout=None):
+        """Run `coro` on the loop and block until it finishes."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result(timeout)
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+            return self._loop
+
 
 class GeminiService:
     def __init__(self):
@@ -9,10 +365,40 @@ class GeminiService:
         genai.configure(api_key=api_key)
         # Use the LATEST stable text model
         self.model = genai.GenerativeModel('gemini-2.5-flash')
-    
+        self.limiter = GeminiLimiter.from_env()
+        self.loop_thread = EventLoopThread()
+
     def chat(self, message):
         try:
-            response = self.model.generate_content(message)
+            response = self.limiter.call(self.model.generate_content, message)
+            return response.text
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    async def achat(self, message):
+        """`chat` as a coroutine, using the SDK's async generation."""
+        try:
+            response = await self.limiter.acall(self.model.generate_content_async, message)
             return response.text
         except Exception as e:
             return f"Error: {str(e)}"
+
+    async def abatch(self, messages):
+        """Answer independent prompts concurrently; replies come back in order."""
+        return list(await asyncio.gather(*(self.achat(message) for message in messages)))
+
+    def batch(self, messages):
+        """
+        `abatch` for synchronous callers. The prompts run concurrently on the
+        shared event loop thread, so this takes as long as the slowest one.
+        """
+        return self.loop_thread.run(self.abatch(list(messages)))
+
+    def chat_stream(self, message):
+        """Yield the response text in chunks as the model generates it."""
+        try:
+            for chunk in self.limiter.stream(self.model.generate_content, message, stream=True):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            yield f"Error: {str(e)}"
@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+# Legacy display format stored in `health_logs.date` (what the frontend reads)
+LEGACY_DATE_FORMAT = "%m-%d-%Y"
+# Sortable ISO format stored in `health_logs.log_date` (what queries use)
+ISO_DATE_FORMAT = "%Y-%m-%d"
+
+
+def to_log_date(dt):
+    """Return the indexed ISO `log_date` value (YYYY-MM-DD) for a date/datetime."""
+    return dt.strftime(ISO_DATE_FORMAT)
+
+
+def legacy_to_log_date(date_str):
+    """Convert a stored MM-DD-YYYY string into its ISO `log_date` value."""
+    return to_log_date(datetime.strptime(date_str, LEGACY_DATE_FORMAT))
+
+
+def ensure_indexes(db):
+    """Create the indexes used by per-user date range and rollup queries."""
+    db.health_logs.create_index([("user_id", 1), ("log_date", 1)])
+    db.health_log_rollups.create_index(
+        [("user_id", 1), ("resolution", 1), ("bucket", 1)],
+        unique=True,
+    )
+
+
+def data_version(db, user_id):
+    """Counter bumped whenever one of the user's logs changes."""
+    doc = db.health_log_versions.find_one({"_id": user_id})
+    return doc["version"] if doc else 0
+
+
+def bump_data_version(db, user_id):
+    """Invalidate anything cached against the user's current data version."""
+    db.health_log_versions.update_one({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def bump_data_versions(db, user_ids=None):
+    """
+    Bump the data version of several users at once, for scripts that write
+    `health_logs` directly; `user_ids` defaults to every user with logs.
+    Returns how many users were bumped.
+    """
+    if user_ids is None:
+        user_ids = db.health_logs.distinct("user_id")
+    ops = [
+        UpdateOne({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True)
+        for user_id in set(user_ids)
+        if user_id is not None
+    ]
+    if ops:
+        db.health_log_versions.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def date_range_filter(user_id, start_date=None, end_date=None):
+    """
+    Build a Mongo filter for one user's logs between two inclusive
+    YYYY-MM-DD bounds. Either bound may be omitted for an open range.
+    """
+    query = {"user_id": user_id}
+
+    log_date = {}
+    if start_date:
+        log_date["$gte"] = to_log_date(datetime.strptime(start_date, ISO_DATE_FORMAT))
+    if end_date:
+        log_date["$lte"] = to_log_date(datetime.strptime(end_date, ISO_DATE_FORMAT))
+    if log_date:
+        query["log_date"] = log_date
+
+    return query
+
+
+# Numeric metrics averaged per bucket by the Graph view
+ROLLUP_METRICS = ["sleepHours", "vital_bpm", "mood", "tookMedication"]
+
+# Supported rollup resolutions (weeks start on Sunday, like the Graph view)
+RESOLUTIONS = ["day", "week", "month", "year"]
+
+# Resolutions kept pre-aggregated in `health_log_rollups`
+ROLLUP_RESOLUTIONS = ["week", "month", "year"]
+
+
+def _bucket_expression(resolution):
+    """Aggregation expression mapping `log_date` to its bucket's first day."""
+    if resolution == "day":
+        return "$log_date"
+    if resolution == "month":
+        return {"$concat": [{"$substrBytes": ["$log_date", 0, 7]}, "-01"]}
+    if resolution == "year":
+        return {"$concat": [{"$substrBytes": ["$log_date", 0, 4]}, "-01-01"]}
+
+    # week: step back (dayOfWeek - 1) days to the preceding Sunday
+    day = {"$dateFromString": {"dateString": "$log_date", "format": "%Y-%m-%d"}}
+    return {
+        "$dateToString": {
+            "format": "%Y-%m-%d",
+            "date": {
+                "$subtract": [
+                    day,
+                    {"$multiply": [{"$subtract": [{"$dayOfWeek": day}, 1]}, 86400000]},
+                ]
+            },
+        }
+    }
+
+
+def _metric_expression(metric):
+    """Numeric value of a metric, or null so `$sum` skips it."""
+    if metric == "tookMedication":
+        return {
+            "$cond": [
+                {"$eq": ["$tookMedication", True]},
+                1,
+                {"$cond": [{"$eq": ["$tookMedication", False]}, 0, None]},
+            ]
+        }
+    return {"$cond": [{"$isNumber": f"${metric}"}, f"${metric}", None]}
+
+
+def rollup_pipeline(query, resolution, per_user=False):
+    """
+    Build an aggregation pipeline that groups the logs matched by `query`
+    into day/week/month/year buckets with a sum and count per metric.
+
+    With `per_user`, buckets are also split by user and each row matches
+    the shape of a `health_log_rollups` document.
+    """
+    bucket = _bucket_expression(resolution)
+    group_id = {"user_id": "$user_id", "bucket": bucket} if per_user else bucket
+
+    group = {"_id": group_id, "log_count": {"$sum": 1}}
+    for metric in ROLLUP_METRICS:
+        value = _metric_expression(metric)
+        group[f"{metric}_sum"] = {"$sum": value}
+        group[f"{metric}_count"] = {"$sum": {"$cond": [{"$eq": [value, None]}, 0, 1]}}
+
+    project = {
+        "_id": 0,
+        "bucket": "$_id.bucket" if per_user else "$_id",
+        "log_count": 1,
+        "sums": {metric: f"${metric}_sum" for metric in ROLLUP_METRICS},
+        "counts": {metric: f"${metric}_count" for metric in ROLLUP_METRICS},
+    }
+    if per_user:
+        project["user_id"] = "$_id.user_id"
+        project["resolution"] = {"$literal": resolution}
+
+    return [
+        {"$match": query},
+        {"$group": group},
+        {"$sort": {"_id": 1}},
+        {"$project": project},
+    ]
+
+
+def format_bucket(row):
+    """Shape one pipeline row or rollup document for the API response."""
+    sums = row.get("sums", {})
+    counts = row.get("counts", {})
+    return {
+        "bucket": row["bucket"],
+        "log_count": row["log_count"],
+        "means": {
+            metric: sums.get(metric, 0) / counts[metric] if counts.get(metric) else None
+            for metric in ROLLUP_METRICS
+        },
+        "counts": {metric: counts.get(metric, 0) for metric in ROLLUP_METRICS},
+    }
+
+
+# ----------------- Incremental rollups -----------------
+
+def bucket_start(day, resolution):
+    """Python twin of `_bucket_expression`: ISO first day of `day`'s bucket."""
+    if resolution == "week":
+        day = day - timedelta(days=(day.weekday() + 1) % 7)
+    elif resolution == "month":
+        day = day.replace(day=1)
+    elif resolution == "year":
+        day = day.replace(month=1, day=1)
+    return to_log_date(day)
+
+
+def metric_value(log, metric):
+    """Python twin of `_metric_expression` for a single log document."""
+    value = log.get(metric)
+    if metric == "tookMedication":
+        return int(value) if isinstance(value, bool) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+
+def rollup_increments(previous, current):
+    """
+    `$inc` document that moves one day's contribution from `previous`
+    (the log before the upsert, or None) to `current`.
+    """
+    # Logs saved before `log_date` existed were never counted in a rollup
+    counted = previous is not None and previous.get("log_date") is not None
+
+    inc = {"log_count": 0 if counted else 1}
+    for metric in ROLLUP_METRICS:
+        old = metric_value(previous, metric) if counted else None
+        new = metric_value(current, metric)
+        inc[f"sums.{metric}"] = (new or 0) - (old or 0)
+        inc[f"counts.{metric}"] = int(new is not None) - int(old is not None)
+    return inc
+
+
+def update_rollups(db, user_id, day, previous, current):
+    """Apply one upserted log's delta to its week, month and year buckets."""
+    inc = rollup_increments(previous, current)
+    ops = [
+        UpdateOne(
+            {"user_id": user_id, "resolution": resolution, "bucket": bucket_start(day, resolution)},
+            {"$inc": inc},
+            upsert=True,
+        )
+        for resolution in ROLLUP_RESOLUTIONS
+    ]
+    db.health_log_rollups.bulk_write(ops, ordered=False)
+
+
+def rollup_range_filter(user_id, resolution, start_date=None, end_date=None):
+    """
+    Filter for the rollup buckets overlapping an inclusive YYYY-MM-DD range.
+    Edge buckets are returned whole.
+    """
+    query = {"user_id": user_id, "resolution": resolution}
+
+    bucket = {}
+    if start_date:
+        bucket["$gte"] = bucket_start(datetime.strptime(start_date, ISO_DATE_FORMAT), resolution)
+    if end_date:
+        bucket["$lte"] = to_log_date(datetime.strptime(end_date, ISO_DATE_FORMAT))
+    if bucket:
+        query["bucket"] = bucket
+
+    return query
+
+
+def rebuild_rollups(db, batch_size=1000):
+    """
+    Recompute `health_log_rollups` from `health_logs`. Upserts that land
+    while a resolution is being rebuilt can be lost, so run it off-peak.
+    """
+    written = 0
+    for resolution in ROLLUP_RESOLUTIONS:
+        db.health_log_rollups.delete_many({"resolution": resolution})
+
+        batch = []
+        pipeline = rollup_pipeline({"log_date": {"$exists": True}}, resolution, per_user=True)
+        for row in db.health_logs.aggregate(pipeline, allowDiskUse=True):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                db.health_log_rollups.insert_many(batch)
+                written += len(batch)
+                batch = []
+
+        if batch:
+            db.health_log_rollups.insert_many(batch)
+            written += len(batch)
+
+    return written
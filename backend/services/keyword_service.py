@@ -0,0 +1,57 @@
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick automaton over labelled keywords.
+
+    `find` reports every label with a keyword occurring anywhere in the
+    text (plain substring matching, like `keyword in text`) in one pass,
+    no matter how many keywords there are.
+    """
+
+    def __init__(self, groups):
+        """`groups` maps a label to its keywords."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [frozenset()]
+
+        outputs = [set()]
+        for label, keywords in groups.items():
+            for keyword in keywords:
+                node = 0
+                for char in keyword:
+                    if char not in self._goto[node]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        outputs.append(set())
+                        self._goto[node][char] = len(self._goto) - 1
+                    node = self._goto[node][char]
+                outputs[node].add(label)
+
+        # Breadth-first, so each node's fail target is finished before it
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                outputs[child] |= outputs[self._fail[child]]
+                queue.append(child)
+
+        self._output = [frozenset(labels) for labels in outputs]
+
+    def find(self, text):
+        """Return the set of labels whose keywords occur in `text`."""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+        return found
@@ -0,0 +1,326 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+import pytesseract
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+from services.worker_service import process_pool_context
+
+try:
+    import pymupdf  # only needed to render scanned PDF pages for OCR
+except ImportError:
+    pymupdf = None
+
+# Finished jobs kept for the stats endpoint
+RECENT_JOBS = 50
+
+# PDF pages with less extractable text than this are treated as scans
+TEXT_LAYER_MIN_CHARS = 20
+
+# Resolution scanned PDF pages are rendered at for OCR
+PDF_OCR_DPI = 300
+
+# Scanned pages of one PDF OCR'd (or queued for the OCR pool) at once
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", "4"))
+
+# Steps applied to uploaded images before OCR, per profile. Phone photos
+# are large, in colour and often rotated; Tesseract is faster and reads
+# more on a page-sized, black-on-white image.
+PREPROCESS_PROFILES = {
+    "none": {},
+    "scan": {"exif_transpose": True, "grayscale": True, "target_dpi": 300},
+    "photo": {
+        "exif_transpose": True,
+        "grayscale": True,
+        "target_dpi": 300,
+        "binarize_radius": 15,
+        "binarize_offset": 10,
+        "autocrop": True,
+    },
+}
+OCR_IMAGE_PROFILE = os.getenv("OCR_IMAGE_PROFILE", "photo")
+
+# Long side of the photographed page (US letter), to turn pixels into DPI
+PAGE_LONG_SIDE_INCHES = 11
+
+# Space kept around the text when cropping
+AUTOCROP_MARGIN = 20
+
+
+def check_profile(profile):
+    """Raise ValueError unless `profile` is one of PREPROCESS_PROFILES."""
+    if profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"Unknown OCR image profile: {profile} (expected one of {', '.join(PREPROCESS_PROFILES)})")
+    return profile
+
+
+# A typo here would otherwise make every image upload OCR to nothing
+check_profile(OCR_IMAGE_PROFILE)
+
+
+def ocr_image(image):
+    """Run Tesseract on a PIL image."""
+    return pytesseract.image_to_string(image)
+
+
+def preprocess_image(image, profile=OCR_IMAGE_PROFILE):
+    """Apply the PREPROCESS_PROFILES steps for `profile` to a PIL image."""
+    options = PREPROCESS_PROFILES[profile]
+
+    if options.get("exif_transpose"):
+        image = ImageOps.exif_transpose(image)
+
+    if options.get("grayscale"):
+        image = image.convert("L")
+
+    # Downscale to the target DPI, assuming the photo shows a whole page
+    target_dpi = options.get("target_dpi")
+    if target_dpi:
+        max_side = target_dpi * PAGE_LONG_SIDE_INCHES
+        if max(image.size) > max_side:
+            image = image.copy()
+            image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+
+    # Adaptive threshold: ink is darker than its neighbourhood by `offset`,
+    # so shadows and uneven lighting don't turn into black blocks
+    radius = options.get("binarize_radius")
+    if radius:
+        gray = image.convert("L")
+        local_mean = gray.filter(ImageFilter.BoxBlur(radius))
+        darker_by = ImageChops.subtract(local_mean, gray)
+        offset = options.get("binarize_offset", 10)
+        image = darker_by.point(lambda value: 0 if value > offset else 255)
+
+    if options.get("autocrop"):
+        bbox = _ink_bbox(image)
+        if bbox:
+            left, top, right, bottom = bbox
+            image = image.crop((
+                max(left - AUTOCROP_MARGIN, 0),
+                max(top - AUTOCROP_MARGIN, 0),
+                min(right + AUTOCROP_MARGIN, image.width),
+                min(bottom + AUTOCROP_MARGIN, image.height),
+            ))
+
+    return image
+
+
+def _ink_bbox(image):
+    # Dark pixels, minus isolated specks, as a white-on-black mask
+    ink = image.convert("L").point(lambda value: 255 if value < 128 else 0)
+    return ink.filter(ImageFilter.MedianFilter(3)).getbbox()
+
+
+def extract_pdf_text(filepath, workers=PDF_PAGE_WORKERS, ocr_page=None):
+    """
+    Extract text from PDF page by page.
+
+    Pages with a text layer keep it. Pages without one (scans) are rendered
+    and OCR'd by `ocr_page(filepath, number)` (default `ocr_pdf_page`),
+    `workers` at a time; Tesseract runs as its own process, so threads are
+    enough to use more cores. Returns (text, pages) where each page reports
+    its number, method ("text" or "ocr"), seconds and chars.
+    """
+    ocr_page = ocr_page or ocr_pdf_page
+    try:
+        with open(filepath, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            pages = [_read_text_layer(number, page) for number, page in enumerate(reader.pages, start=1)]
+    except Exception as e:
+        print(f"PDF extraction error: {e}")
+        return "", []
+
+    scanned = [page for page in pages if len(page["text"].strip()) < TEXT_LAYER_MIN_CHARS]
+    if scanned:
+        with ThreadPoolExecutor(max_workers=min(workers, len(scanned))) as pool:
+            ocr_results = pool.map(lambda page: ocr_page(filepath, page["page"]), scanned)
+            for page, ocr_result in zip(scanned, ocr_results):
+                # Keep whatever the text layer had if OCR found less
+                if len(ocr_result["text"].strip()) >= len(page["text"].strip()):
+                    page["text"] = ocr_result["text"]
+                page["method"] = "ocr"
+                page["seconds"] += ocr_result["seconds"]
+                for field in ("queue_seconds", "error"):
+                    if field in ocr_result:
+                        page[field] = ocr_result[field]
+
+    texts = [page.pop("text") for page in pages]
+    for page, page_text in zip(pages, texts):
+        page["seconds"] = round(page["seconds"], 3)
+        page["chars"] = len(page_text)
+
+    # Joined once, at the end
+    return "\n".join(texts), pages
+
+
+def extractor_for(filepath):
+    """The extract function for an uploaded file, by its extension."""
+    return extract_pdf_text if filepath.lower().endswith(".pdf") else extract_image_text
+
+
+def extract_image_text(filepath, profile=None):
+    """
+    Extract text from image using OCR, after preprocessing with `profile`
+    (default OCR_IMAGE_PROFILE). Returns (text, pages) like extract_pdf_text.
+    """
+    profile = check_profile(profile or OCR_IMAGE_PROFILE)
+    page = {"page": 1, "method": "ocr", "profile": profile}
+    started = time.perf_counter()
+    text = ""
+    try:
+        with Image.open(filepath) as image:
+            prepared = preprocess_image(image, profile)
+            page["preprocess_seconds"] = round(time.perf_counter() - started, 3)
+            text = ocr_image(prepared)
+    except Exception as e:
+        print(f"OCR error: {e}")
+        page["error"] = str(e)
+    page["seconds"] = round(time.perf_counter() - started, 3)
+    page["chars"] = len(text)
+    return text, [page]
+
+
+def _read_text_layer(number, page):
+    started = time.perf_counter()
+    text = page.extract_text() or ""
+    return {"page": number, "method": "text", "text": text, "seconds": time.perf_counter() - started}
+
+
+def ocr_pdf_page(filepath, number):
+    """Render page `number` of a PDF and OCR it; returns its text, seconds and any error."""
+    started = time.perf_counter()
+    result = {"text": ""}
+    if pymupdf is None:
+        result["error"] = "PyMuPDF is not installed; scanned pages can't be rendered"
+    else:
+        try:
+            # One document handle per thread: PyMuPDF objects aren't thread-safe
+            with pymupdf.open(filepath) as doc:
+                pixmap = doc[number - 1].get_pixmap(dpi=PDF_OCR_DPI, colorspace=pymupdf.csGRAY)
+            image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+            result["text"] = ocr_image(image)
+        except Exception as e:
+            print(f"OCR error on page {number}: {e}")
+            result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _timed(fn, args):
+    # Runs in the worker process
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class OCRBusy(Exception):
+    """Every worker is busy and the queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("OCR is busy, please try again shortly")
+        self.retry_after = retry_after
+
+
+class OCRExecutor:
+    """
+    Run OCR in a fixed-size process pool, away from request threads.
+
+    At most `max_workers` jobs run and `max_queue` more wait; past that,
+    `run` raises OCRBusy instead of queueing, so a burst of large scans
+    can't back up every web worker. The pool is started on first use (and
+    again after a fork). A job is one image or one scanned PDF page, so the
+    pool never runs more than `max_workers` Tesseract processes. Queue wait
+    and run time are recorded per job.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+        self._pending = 0
+        self._jobs = 0
+        self._rejected = 0
+        self._run_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._recent = deque(maxlen=RECENT_JOBS)
+
+    def run(self, fn, *args, kind=None):
+        """
+        Run `fn(*args)` in the pool and return (result, timing), where
+        timing has the job's `queue_seconds` and `run_seconds`.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise OCRBusy(self.retry_after())
+
+        with self._lock:
+            self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            result, run_seconds = self._get_pool().submit(_timed, fn, args).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            with self._lock:
+                self._pool = None
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+        timing = {
+            "kind": kind or getattr(fn, "__name__", "ocr"),
+            "queue_seconds": round(max(time.perf_counter() - submitted - run_seconds, 0.0), 3),
+            "run_seconds": round(run_seconds, 3),
+        }
+        with self._lock:
+            self._jobs += 1
+            self._run_seconds += run_seconds
+            self._wait_seconds += timing["queue_seconds"]
+            self._recent.append(timing)
+        return result, timing
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up (at least 1)."""
+        with self._lock:
+            avg = self._run_seconds / self._jobs if self._jobs else 1.0
+            backlog = max(self._pending - self.max_workers, 0)
+        return max(1, math.ceil(avg * (backlog / self.max_workers + 1)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "jobs": self._jobs,
+                "rejected": self._rejected,
+                "avg_run_seconds": round(self._run_seconds / self._jobs, 3) if self._jobs else None,
+                "avg_queue_seconds": round(self._wait_seconds / self._jobs, 3) if self._jobs else None,
+                "recent": list(self._recent),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=process_pool_context())
+            return self._pool
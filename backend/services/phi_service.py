@@ -0,0 +1,99 @@
+import os
+import re
+from collections import deque
+from itertools import islice
+
+# 🔐 PHI PATTERNS (Protected Health Information), in priority order
+PHI_PATTERNS = {
+    'name': r'\b(?:my name is|i am|i\'m|called)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\b',
+    'ssn': r'\b\d{3}-\d{2}-\d{4}\b',
+    'phone': r'\b(?:\+?1[-.]?)?\(?\d{3}\)?[-.]?\d{3}[-.]?\d{4}\b',
+    'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    'dob': r'\b(?:\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{4})\b',
+    'address': r'\b\d+\s+[A-Za-z0-9\s]+(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln)\b'
+}
+
+# Every pattern as one named alternative, so a single scan finds all spans.
+# The regex engine takes the leftmost match and, at the same position, the
+# earliest category, then resumes after it: overlapping spans never both win.
+# All patterns open with \b, which is hoisted (plus a lookahead on the
+# characters a match can start with) so most positions fail on one check.
+assert all(pattern.startswith(r"\b") for pattern in PHI_PATTERNS.values())
+PHI_REGEX = re.compile(
+    r"\b(?=[\w(+.%-])(?:"
+    + "|".join(f"(?P<{category}>{pattern[2:]})" for category, pattern in PHI_PATTERNS.items())
+    + ")",
+    re.IGNORECASE,
+)
+
+
+def anonymize(text):
+    """
+    Replace PHI spans in `text` with `[CATEGORY_i]` tokens, numbered per
+    category in order of appearance. Returns (anonymized text, {token: category}).
+    """
+    pieces = []
+    replacements = {}
+    counts = dict.fromkeys(PHI_PATTERNS, 0)
+    last = 0
+
+    for match in PHI_REGEX.finditer(text):
+        category = match.lastgroup
+        token = f"[{category.upper()}_{counts[category]}]"
+        counts[category] += 1
+
+        pieces.append(text[last:match.start()])
+        pieces.append(token)
+        replacements[token] = category
+        last = match.end()
+
+    if not replacements:
+        return text, replacements
+
+    pieces.append(text[last:])
+    return "".join(pieces), replacements
+
+
+# ----------------- Batch anonymization -----------------
+
+# Texts sent to a worker process at a time
+BATCH_CHUNK_SIZE = 500
+
+
+def _anonymize_chunk(texts):
+    return [anonymize(text) for text in texts]
+
+
+def _chunks(texts, size):
+    texts = iter(texts)
+    while True:
+        chunk = list(islice(texts, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def anonymize_batch(texts, executor=None, chunk_size=BATCH_CHUNK_SIZE, max_pending=None):
+    """
+    Yield `anonymize(text)` for every text in the iterable, in order.
+
+    With a ProcessPoolExecutor, chunks of `chunk_size` texts run across its
+    workers. At most `max_pending` chunks (default: two per CPU) are in
+    flight, so a large iterable such as a Mongo cursor is streamed rather
+    than loaded.
+    """
+    if executor is None:
+        for chunk in _chunks(texts, chunk_size):
+            yield from _anonymize_chunk(chunk)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * (os.cpu_count() or 1)
+    pending = deque()
+    for chunk in _chunks(texts, chunk_size):
+        pending.append(executor.submit(_anonymize_chunk, chunk))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+
+    while pending:
+        yield from pending.popleft().result()
@@ -0,0 +1,250 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.ocr_service import OCRBusy, extract_pdf_text, extractor_for, ocr_pdf_page
+from services.worker_service import current_worker, orphaned_filter
+
+# Processing stages, in order; each gets a status on the prescription document
+STAGES = ("extraction", "parsing", "explanation")
+
+# How many times a job waits out a full OCR pool before giving up
+OCR_BUSY_RETRIES = 5
+
+# Prescription statuses that a live worker still has to finish
+UNFINISHED_STATUSES = ("pending", "processing")
+
+# Results shared by every upload of the same file
+REUSABLE_FIELDS = (
+    "extracted_text",
+    "ocr_timing",
+    "medications",
+    "warnings",
+    "allergies",
+    "diagnoses",
+    "ai_explanation",
+    "stages",
+)
+
+
+# Explanations that report a failure instead of explaining anything
+FAILED_EXPLANATION = re.compile(r"^(?:Error:|Unable to generate explanation)")
+
+
+def new_stages():
+    """Stage status block for a freshly uploaded prescription."""
+    return {stage: {"status": "pending"} for stage in STAGES}
+
+
+def save_content_addressed(stream, folder, extension, chunk_size=64 * 1024):
+    """
+    Save an upload as `<sha256>.<extension>` in `folder`, hashing it while
+    it is written. Returns (path, content_hash); if the same content is
+    already stored, that copy is kept and the new one discarded.
+    """
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                digest.update(chunk)
+                out.write(chunk)
+
+        content_hash = digest.hexdigest()
+        path = os.path.join(folder, f"{content_hash}.{extension}")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path, content_hash
+
+
+def find_processed(collection, content_hash):
+    """
+    Latest completed prescription with this content whose results are worth
+    reusing: extraction found text and the explanation didn't fail. None if
+    there is none, so the upload is processed again.
+    """
+    return collection.find_one(
+        {
+            "content_hash": content_hash,
+            "status": "completed",
+            "extracted_text": {"$regex": r"\S"},
+            "ai_explanation": {"$not": FAILED_EXPLANATION},
+        },
+        {field: 1 for field in REUSABLE_FIELDS},
+        sort=[("uploaded_at", -1)],
+    )
+
+
+class PrescriptionPipeline:
+    """
+    Process uploaded prescriptions in a background thread pool.
+
+    The upload request only saves the file and inserts a `prescriptions`
+    document with status "pending". A worker then runs extraction (OCR in
+    the OCR process pool, one job per image or scanned PDF page), parsing
+    and explanation, writing each stage's status, timing and results to the
+    document, so any gunicorn worker can report progress. At most `max_pending` jobs are accepted per process; `submit`
+    raises OCRBusy past that. Documents record the worker process and time
+    they were queued at, so `recover` can pick up the ones a worker left
+    unfinished.
+    """
+
+    def __init__(self, collection, ocr_executor, parse, explain, max_workers=4, max_pending=16, stale_seconds=900):
+        self.collection = collection
+        self.ocr_executor = ocr_executor
+        self.parse = parse
+        self.explain = explain
+        self.stale_seconds = stale_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prescription")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, prescription_id, filepath, extract):
+        """Queue processing of an uploaded file with `extract(filepath)`."""
+        if not self._slots.acquire(blocking=False):
+            raise OCRBusy(self.ocr_executor.retry_after())
+        try:
+            future = self.executor.submit(self._run, prescription_id, filepath, extract)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def recover(self):
+        """
+        Requeue prescriptions that no worker will finish: those left pending
+        or processing by a worker process that exited, or queued more than
+        `stale_seconds` ago. A document is requeued once; if it is orphaned
+        again, or the queue is full, it is marked failed instead. Returns
+        (requeued, failed) counts.
+        """
+        query = orphaned_filter(self.collection, UNFINISHED_STATUSES, "queued_at", self.stale_seconds)
+        requeued = failed = 0
+        for doc in self.collection.find(query, {"filepath": 1, "worker": 1, "recovered_at": 1}):
+            # Only the worker that swaps in its own name gets to handle it
+            owned_by_orphan = {
+                "_id": doc["_id"],
+                "status": {"$in": list(UNFINISHED_STATUSES)},
+                "worker": doc.get("worker"),
+            }
+            if doc.get("recovered_at"):
+                failed += self.collection.update_one(owned_by_orphan, {"$set": {
+                    "status": "failed",
+                    "error": "Processing was interrupted again, please upload the file again",
+                }}).modified_count
+                continue
+
+            now = datetime.now()
+            claimed = self.collection.update_one(owned_by_orphan, {"$set": {
+                "status": "pending",
+                "stages": new_stages(),
+                "worker": current_worker(),
+                "queued_at": now,
+                "recovered_at": now,
+            }})
+            if not claimed.modified_count:
+                continue
+
+            try:
+                self.submit(doc["_id"], doc["filepath"], extractor_for(doc["filepath"]))
+                requeued += 1
+            except OCRBusy:
+                self._fail(doc["_id"], "Processing was interrupted, please upload the file again")
+                failed += 1
+        return requeued, failed
+
+    def _run(self, prescription_id, filepath, extract):
+        try:
+            self._update(prescription_id, {"status": "processing"})
+            extracted = self._stage(prescription_id, "extraction", self._extract, extract, filepath)
+            text = extracted["extracted_text"]
+            parsed = self._stage(prescription_id, "parsing", self.parse, text)
+            self._stage(prescription_id, "explanation", self._explain, text, parsed["medications"])
+            self._update(prescription_id, {"status": "completed", "completed_at": datetime.now()})
+        except Exception as e:
+            print(f"❌ Prescription processing error: {str(e)}")
+            self._fail(prescription_id, str(e))
+
+    def _fail(self, prescription_id, error):
+        # Leave the failed stage's own status alone; this covers errors between stages too
+        try:
+            self._update(prescription_id, {"status": "failed", "error": error})
+        except Exception as e:
+            print(f"❌ Could not mark prescription {prescription_id} failed: {str(e)}")
+
+    def _stage(self, prescription_id, stage, fn, *args):
+        """Run one stage, storing its result fields and status on the document."""
+        self._update(prescription_id, {
+            f"stages.{stage}.status": "running",
+            f"stages.{stage}.started_at": datetime.now(),
+        })
+        started = time.perf_counter()
+
+        try:
+            fields = fn(*args)
+        except Exception as e:
+            self._update(prescription_id, {
+                f"stages.{stage}.status": "failed",
+                f"stages.{stage}.error": str(e),
+                "status": "failed",
+            })
+            raise
+
+        self._update(prescription_id, {
+            **fields,
+            f"stages.{stage}.status": "done",
+            f"stages.{stage}.seconds": round(time.perf_counter() - started, 3),
+        })
+        return fields
+
+    def _extract(self, extract, filepath):
+        if extract is extract_pdf_text:
+            return self._extract_pdf(filepath)
+        (text, pages), timing = self._ocr(extract, filepath)
+        return {"extracted_text": text, "ocr_timing": {**timing, "pages": pages}}
+
+    def _extract_pdf(self, filepath):
+        # The text layer is read in this thread; each scanned page is its own
+        # OCR job, so one long scan is spread over every OCR worker
+        timings = []
+
+        def ocr_page(path, number):
+            result, timing = self._ocr(ocr_pdf_page, path, number)
+            timings.append(timing)
+            return {**result, "queue_seconds": timing["queue_seconds"]}
+
+        text, pages = extract_pdf_text(filepath, ocr_page=ocr_page)
+        return {"extracted_text": text, "ocr_timing": {
+            "kind": "extract_pdf_text",
+            "queue_seconds": round(sum(timing["queue_seconds"] for timing in timings), 3),
+            "run_seconds": round(sum(timing["run_seconds"] for timing in timings), 3),
+            "pages": pages,
+        }}
+
+    def _ocr(self, fn, *args):
+        for attempt in range(OCR_BUSY_RETRIES + 1):
+            try:
+                return self.ocr_executor.run(fn, *args)
+            except OCRBusy as e:
+                if attempt == OCR_BUSY_RETRIES:
+                    raise
+                time.sleep(e.retry_after)
+
+    def _explain(self, text, medications):
+        # The explainer adds per-medication summaries in place
+        explanation = self.explain(text, medications)
+        return {"ai_explanation": explanation, "medications": medications}
+
+    def _update(self, prescription_id, fields):
+        self.collection.update_one({"_id": prescription_id}, {"$set": fields})
@@ -0,0 +1,158 @@
+import hashlib
+import re
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+
+def normalize_message(text):
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question."""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!.").strip().lower()
+
+
+def response_cache_key(message, classification, template_hash):
+    """Cache key for an anonymized message answered with a given prompt template."""
+    payload = "\x1f".join([normalize_message(message), classification, template_hash])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(ABC):
+    """
+    Hit/miss accounting shared by the cache backends, which implement
+    `_get`, `_set` and `_size`. Counters are per process; `stats()` turns
+    them into an estimate of model time saved.
+    """
+
+    backend = None
+
+    def __init__(self, max_entries=1000, ttl_seconds=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.model_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """Cached response for `key`, or None."""
+        response = self._get(key)
+        with self._stats_lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, key, response, model_seconds=0.0):
+        """Store a model response along with how long it took to generate."""
+        self._set(key, response)
+        with self._stats_lock:
+            self.stores += 1
+            self.model_seconds += model_seconds
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            avg_model_seconds = self.model_seconds / self.stores if self.stores else None
+            return {
+                "backend": self.backend,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "entries": self._size(),
+                "avg_model_seconds": round(avg_model_seconds, 3) if avg_model_seconds is not None else None,
+                "estimated_seconds_saved": round(self.hits * avg_model_seconds, 1) if avg_model_seconds else 0.0,
+            }
+
+    @abstractmethod
+    def _get(self, key):
+        """Stored response for `key`, or None if missing or expired."""
+
+    @abstractmethod
+    def _set(self, key, response):
+        """Store `response` under `key`."""
+
+    @abstractmethod
+    def _size(self):
+        """Number of stored entries."""
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process TTL + LRU cache (one per worker)."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries=1000, ttl_seconds=24 * 3600):
+        super().__init__(max_entries, ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def _set(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _size(self):
+        return len(self._entries)
+
+
+class MongoResponseCache(ResponseCache):
+    """
+    Cache shared by every worker, stored in a Mongo collection. A TTL index
+    expires entries; the least recently used are trimmed past `max_entries`.
+    """
+
+    backend = "mongo"
+
+    def __init__(self, collection, max_entries=1000, ttl_seconds=24 * 3600):
+        super().__init__(max_entries, ttl_seconds)
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        self.collection.create_index([("last_used", ASCENDING)])
+
+    def _get(self, key):
+        # The TTL monitor only runs once a minute, so check age here as well
+        fresh_after = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        doc = self.collection.find_one_and_update(
+            {"_id": key, "created_at": {"$gt": fresh_after}},
+            {"$set": {"last_used": datetime.now()}},
+            projection={"response": 1},
+        )
+        return doc["response"] if doc else None
+
+    def _set(self, key, response):
+        now = datetime.now()
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"response": response, "created_at": now, "last_used": now}},
+            upsert=True,
+        )
+
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess > 0:
+            stale = self.collection.find({}, {"_id": 1}).sort("last_used", ASCENDING).limit(excess)
+            self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stale]}})
+
+    def _size(self):
+        return self.collection.estimated_document_count()
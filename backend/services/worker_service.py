@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+import socket
+from datetime import datetime, timedelta
+
+
+def current_worker():
+    """`host:pid` of this process, recorded on the background jobs it runs."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def worker_exited(worker):
+    """True if `worker` was a process on this host that is no longer running."""
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def orphaned_filter(collection, statuses, created_field, stale_after):
+    """
+    Mongo filter for documents in one of `statuses` that no running process
+    will finish: the worker that owned them on this host has exited, or
+    they were created more than `stale_after` seconds ago (which also
+    covers workers on other hosts).
+    """
+    unfinished = {"status": {"$in": list(statuses)}}
+    exited = [worker for worker in collection.distinct("worker", unfinished) if worker_exited(worker)]
+    return {
+        **unfinished,
+        "$or": [
+            {"worker": {"$in": exited}},
+            {created_field: {"$lt": datetime.now() - timedelta(seconds=stale_after)}},
+        ],
+    }
+
+
+def process_pool_context():
+    """
+    Multiprocessing context for the app's process pools. Forking a process
+    that already runs threads can copy a lock some thread holds into the
+    child, so workers come from a fork server (spawned where there is none).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
@@ -0,0 +1,43 @@
+import unittest
+from datetime import datetime, timedelta
+
+from services.chat_history_service import estimate_tokens, format_turn, select_turns
+
+
+def make_history(count):
+    """Logged turns, newest first, like the chat history query returns."""
+    start = datetime(2031, 1, 1)
+    turns = [
+        {
+            "user_message": f"question {i} " + "x" * 80,
+            "bot_response": f"answer {i} " + "y" * 80,
+            "timestamp": start + timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+    return turns[::-1]
+
+
+class ChatHistoryTestCase(unittest.TestCase):
+    def test_all_turns_kept_when_within_budget(self):
+        history = make_history(3)
+        kept, dropped = select_turns(history, 10000)
+        self.assertEqual(kept, history)
+        self.assertEqual(dropped, [])
+
+    def test_newest_turns_kept_within_budget(self):
+        history = make_history(10)
+        per_turn = estimate_tokens(format_turn(history[0]))
+
+        kept, dropped = select_turns(history, per_turn * 4)
+        self.assertEqual(len(kept), 4)
+        self.assertEqual(kept[0]["user_message"], history[0]["user_message"])
+        self.assertEqual(dropped, history[4:])
+
+    def test_budget_smaller_than_one_turn_keeps_nothing(self):
+        history = make_history(2)
+        self.assertEqual(select_turns(history, 1), ([], history))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,15 @@
 import io
+import shutil
+import tempfile
 import unittest
 import json
+import time
+import uuid
+from unittest.mock import patch
+
+import app as app_module
 from app import create_app
+from services.prescription_service import PrescriptionPipeline
 
 
 class TestBaymaxChatbot(unittest.TestCase):
@@ -10,6 +18,14 @@ class TestBaymaxChatbot(unittest.TestCase):
         self.app.testing = True
         self.client = self.app.test_client()
 
+        # Keep uploaded files out of the source tree
+        self.upload_folder = app_module.UPLOAD_FOLDER
+        app_module.UPLOAD_FOLDER = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(app_module.UPLOAD_FOLDER, ignore_errors=True)
+        app_module.UPLOAD_FOLDER = self.upload_folder
+
     def test_health_endpoint(self):
         resp = self.client.get("/health")
         self.assertEqual(resp.status_code, 200)
@@ -79,7 +95,7 @@ class TestBaymaxChatbot(unittest.TestCase):
             content_type="multipart/form-data",
         )
         # Endpoint should at least return JSON and a 2xx/4xx code, not 500
-        self.assertIn(resp.status_code, (200, 400))
+        self.assertIn(resp.status_code, (200, 202, 400))
         body = resp.get_json()
         self.assertIsInstance(body, dict)
 
@@ -117,7 +133,7 @@ class TestBaymaxChatbot(unittest.TestCase):
             data={"file": (fake_pdf, "test.pdf"), "user_id": "p-user"},
             content_type="multipart/form-data",
         )
-        self.assertEqual(upload_resp.status_code, 200)
+        self.assertIn(upload_resp.status_code, (200, 202))
         presc = upload_resp.get_json()
         presc_id = presc["prescription_id"]
 
@@ -167,6 +183,129 @@ class TestBaymaxChatbot(unittest.TestCase):
         self.assertNotEqual(d2["classification"], "PHI_DETECTED")
         self.assertIn("response", d2)
 
+    def test_history_window_in_prompt_and_cleared_after_phi(self):
+        prompts = []
+
+        class RecordingGemini:
+            def chat(self, prompt):
+                prompts.append(prompt)
+                return "Rest and fluids usually help."
+
+        original = app_module.gemini_service
+        app_module.gemini_service = RecordingGemini()
+        try:
+            for message in ("I have a cough", "What about a fever?"):
+                self.client.post("/api/chat", json={"message": message, "user_id": "window-user"})
+            self.assertIn("User: I have a cough", prompts[-1])
+            self.assertNotIn("What about a fever?\nBaymax", prompts[-1])
+
+            self.client.post("/api/chat", json={"message": "My SSN is 123-45-6789", "user_id": "window-user"})
+            self.client.post("/api/chat", json={"message": "Is a sore throat contagious?", "user_id": "window-user"})
+            self.assertNotIn("CONVERSATION HISTORY", prompts[-1])
+        finally:
+            app_module.gemini_service = original
+
+    def test_long_history_is_trimmed_and_summarized(self):
+        import os
+
+        prompts = []
+
+        class RecordingGemini:
+            def chat(self, prompt):
+                prompts.append(prompt)
+                if prompt.startswith("Summarize this conversation"):
+                    return "User asked about colds and coughs."
+                return "Rest and fluids usually help."
+
+        original = app_module.gemini_service
+        app_module.gemini_service = RecordingGemini()
+        os.environ["CHAT_HISTORY_TOKEN_BUDGET"] = "60"
+        os.environ["CHAT_SUMMARY_EVERY"] = "2"
+        try:
+            client = create_app().test_client()
+            user_id = f"summary-user-{uuid.uuid4().hex[:8]}"
+            for i in range(6):
+                client.post("/api/chat", json={"message": f"Question {i} about a cough", "user_id": user_id})
+
+            self.assertTrue(any(p.startswith("Summarize this conversation") for p in prompts))
+            self.assertIn("Summary of earlier conversation: User asked about colds and coughs.", prompts[-1])
+            self.assertNotIn("Question 0 about a cough", prompts[-1])
+            self.assertIn("Question 4 about a cough", prompts[-1])
+        finally:
+            app_module.gemini_service = original
+            del os.environ["CHAT_HISTORY_TOKEN_BUDGET"]
+            del os.environ["CHAT_SUMMARY_EVERY"]
+
+    def test_generic_question_answered_from_cache(self):
+        prompts = []
+
+        class RecordingGemini:
+            def chat(self, prompt):
+                prompts.append(prompt)
+                return "Rest and fluids usually help."
+
+        original = app_module.gemini_service
+        app_module.gemini_service = RecordingGemini()
+        try:
+            client = create_app().test_client()
+            # Fresh users, so neither prompt carries history
+            run = uuid.uuid4().hex[:8]
+            first = client.post("/api/chat", json={"message": "What helps a sore throat?", "user_id": f"cache-a-{run}"})
+            second = client.post("/api/chat", json={"message": "what helps a sore throat", "user_id": f"cache-b-{run}"})
+
+            self.assertFalse(first.get_json()["cached"])
+            self.assertTrue(second.get_json()["cached"])
+            self.assertEqual(second.get_json()["response"], "Rest and fluids usually help.")
+            self.assertEqual(len(prompts), 1)
+
+            stats = client.get("/api/chat/cache-stats").get_json()
+            self.assertEqual(stats["hits"], 1)
+            self.assertEqual(stats["misses"], 1)
+        finally:
+            app_module.gemini_service = original
+
+    def test_chat_stream_sends_chunks_and_logs_full_reply(self):
+        prompts = []
+
+        class StreamingGemini:
+            def chat(self, prompt):
+                prompts.append(prompt)
+                return "ok"
+
+            def chat_stream(self, prompt):
+                yield "Rest and "
+                yield "fluids usually help."
+
+        original = app_module.gemini_service
+        app_module.gemini_service = StreamingGemini()
+        try:
+            user_id = f"stream-user-{uuid.uuid4().hex[:8]}"
+            resp = self.client.post("/api/chat/stream", json={"message": "I have a cough", "user_id": user_id})
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.content_type.startswith("text/event-stream"))
+
+            events = [event for event in resp.data.decode("utf-8").split("\n\n") if event]
+            chunks = [json.loads(e[len("data: "):])["text"] for e in events if e.startswith("data: ")]
+            self.assertEqual(chunks, ["Rest and ", "fluids usually help."])
+            self.assertTrue(events[-1].startswith("event: done"))
+
+            # The next turn's history includes the whole streamed reply
+            self.client.post("/api/chat", json={"message": "And a fever?", "user_id": user_id})
+            self.assertIn("Baymax: Rest and fluids usually help.", prompts[-1])
+        finally:
+            app_module.gemini_service = original
+
+    def test_chat_stream_emergency_is_single_event(self):
+        resp = self.client.post("/api/chat/stream", json={"message": "I can't breathe", "user_id": "stream-emerg"})
+        self.assertEqual(resp.status_code, 200)
+        events = [event for event in resp.data.decode("utf-8").split("\n\n") if event]
+        self.assertIn("911", json.loads(events[0][len("data: "):])["text"])
+        self.assertIn('"classification": "EMERGENCY"', events[1])
+
+    def test_chat_stream_empty_message_400(self):
+        resp = self.client.post("/api/chat/stream", json={"message": "", "user_id": "user_a"})
+        self.assertEqual(resp.status_code, 400)
+
     def test_prescription_upload_image(self):
     # Fake PNG file in memory
         fake_png = io.BytesIO(b"\x89PNG\r\n\x1a\nfakepng")
@@ -180,7 +319,7 @@ class TestBaymaxChatbot(unittest.TestCase):
             content_type="multipart/form-data",
         )
         # Just ensure it doesn't 500 and returns JSON
-        self.assertIn(resp.status_code, (200, 400))
+        self.assertIn(resp.status_code, (200, 202, 400))
         body = resp.get_json()
         self.assertIsInstance(body, dict)
 
@@ -204,7 +343,7 @@ class TestBaymaxChatbot(unittest.TestCase):
             data={"file": (fake_pdf, "latest.pdf"), "user_id": "ctx-user"},
             content_type="multipart/form-data",
         )
-        self.assertEqual(upload_resp.status_code, 200)
+        self.assertIn(upload_resp.status_code, (200, 202))
 
         # Now call chat without prescription_id; should hit "most recent on file" branch
         payload = {
@@ -266,30 +405,30 @@ class TestBaymaxChatbot(unittest.TestCase):
 
     
     def test_upload_ocr_failure_returns_error(self):
-        from app import extract_pdf_text
-
-        original = extract_pdf_text
-
-        def boom(path):
-            raise RuntimeError("OCR failed")
-
-        try:
-            # Monkeypatch
-            import app as app_module
-            app_module.extract_pdf_text = boom
-
-            fake_pdf = io.BytesIO(b"%PDF-1.4 fake")
+        # Fail in the pipeline thread: a patched extract function would have
+        # to be pickled for the OCR pool
+        with patch.object(PrescriptionPipeline, "_extract", side_effect=RuntimeError("OCR failed")):
+            # Unique content, so no earlier upload's results are reused
+            fake_pdf = io.BytesIO(f"%PDF-1.4 fake {uuid.uuid4()}".encode())
             resp = self.client.post(
                 "/api/prescription/upload",
                 data={"file": (fake_pdf, "fail.pdf"), "user_id": "ocr-fail"},
                 content_type="multipart/form-data",
             )
-            self.assertIn(resp.status_code, (400, 500))
-            data = resp.get_json()
-            self.assertIsInstance(data, dict)
-        finally:
-            # Restore
-            app_module.extract_pdf_text = original
+            self.assertEqual(resp.status_code, 202)
+            prescription_id = resp.get_json()["prescription_id"]
+
+            # Extraction runs in the background; the failure shows up in its status
+            for _ in range(50):
+                data = self.client.get(f"/api/prescription/{prescription_id}").get_json()
+                if data["status"] == "failed":
+                    break
+                time.sleep(0.1)
+
+        self.assertEqual(data["status"], "failed")
+        self.assertEqual(data["stages"]["extraction"]["status"], "failed")
+        self.assertEqual(data["stages"]["extraction"]["error"], "OCR failed")
+        self.assertEqual(data["stages"]["parsing"]["status"], "pending")
         
 
     
@@ -338,7 +477,7 @@ class TestBaymaxChatbot(unittest.TestCase):
             data={"file": (fake_pdf, "ctx.pdf"), "user_id": "ctx-user"},
             content_type="multipart/form-data",
         )
-        self.assertEqual(upload_resp.status_code, 200)
+        self.assertIn(upload_resp.status_code, (200, 202))
         presc = upload_resp.get_json()
         presc_id = presc["prescription_id"]
 
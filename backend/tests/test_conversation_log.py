@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from services.conversation_log_service import ConversationLogWriter
+
+
+class RecordingCollection:
+    """Just enough of a pymongo collection to watch how documents are written."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_many(self, docs, ordered=True):
+        self.release.wait()
+        time.sleep(self.delay)
+        self.batches.append(list(docs))
+
+    def insert_one(self, doc):
+        self.batches.append([doc])
+
+    @property
+    def docs(self):
+        return [doc for batch in self.batches for doc in batch]
+
+
+def turn(user_hash, i):
+    return {"user_id_hash": user_hash, "user_message": f"message {i}", "bot_response": "ok"}
+
+
+class ConversationLogWriterTestCase(unittest.TestCase):
+    def test_sync_mode_writes_in_the_caller(self):
+        collection = RecordingCollection()
+        writer = ConversationLogWriter(collection, durability="sync")
+        writer.log(turn("u1", 0))
+        self.assertEqual(len(collection.batches), 1)
+        self.assertIn("_id", collection.docs[0])
+
+    def test_batches_by_size(self):
+        collection = RecordingCollection()
+        writer = ConversationLogWriter(collection, batch_size=3, flush_interval=5)
+        for i in range(7):
+            writer.log(turn("u1", i))
+        writer.close()
+
+        self.assertEqual([len(batch) for batch in collection.batches], [3, 3, 1])
+        self.assertEqual([doc["user_message"] for doc in collection.docs], [f"message {i}" for i in range(7)])
+
+    def test_flushes_after_interval(self):
+        collection = RecordingCollection()
+        writer = ConversationLogWriter(collection, batch_size=100, flush_interval=0.05)
+        writer.log(turn("u1", 0))
+
+        time.sleep(0.3)
+        self.assertEqual(len(collection.docs), 1)
+        writer.close()
+
+    def test_pending_turns_visible_until_written(self):
+        collection = RecordingCollection()
+        collection.release.clear()  # hold the writer inside insert_many
+        writer = ConversationLogWriter(collection, batch_size=1, flush_interval=0.01)
+
+        writer.log(turn("u1", 0))
+        writer.log(turn("u1", 1))
+        writer.log(turn("u2", 2))
+        self.assertEqual([doc["user_message"] for doc in writer.pending("u1")], ["message 1", "message 0"])
+
+        collection.release.set()
+        writer.flush(timeout=2)
+        self.assertEqual(writer.pending("u1"), [])
+        self.assertEqual(writer.pending("u2"), [])
+        writer.close()
+
+    def test_unknown_durability_rejected(self):
+        with self.assertRaises(ValueError):
+            ConversationLogWriter(RecordingCollection(), durability="eventual")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from services.export_cache_service import ExportCache
+
+
+class ExportCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_key_changes_with_data_version(self):
+        first = ExportCache.key("u1", "2031-01-01", None, ["mood", "sleep"], "csv", 3)
+        same = ExportCache.key("u1", "2031-01-01", None, ["sleep", "mood"], "csv", 3)
+        bumped = ExportCache.key("u1", "2031-01-01", None, ["mood", "sleep"], "csv", 4)
+
+        self.assertEqual(first, same)
+        self.assertNotEqual(first, bumped)
+
+    def test_stream_is_cached_only_when_complete(self):
+        cache = ExportCache(self.folder)
+
+        chunks = cache.store_stream("abc", "csv", iter([b"a,b\r\n", b"1,2\r\n"]))
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(cache.get("abc", "csv"))
+
+        self.assertEqual(list(cache.store_stream("abc", "csv", iter([b"a,b\r\n"]))), [b"a,b\r\n"])
+        with open(cache.get("abc", "csv"), "rb") as f:
+            self.assertEqual(f.read(), b"a,b\r\n")
+
+    def test_store_file_keeps_the_new_entry_and_drops_failed_writes(self):
+        cache = ExportCache(self.folder, max_bytes=50)
+
+        def write(path):
+            with open(path, "wb") as f:
+                f.write(b"%PDF" + b"x" * 100)
+
+        path = cache.store_file("big", "pdf", write)
+        self.assertEqual(cache.get("big", "pdf"), path)
+
+        def fail(path):
+            with open(path, "wb") as f:
+                f.write(b"%PDF")
+            raise RuntimeError("render failed")
+
+        with self.assertRaises(RuntimeError):
+            cache.store_file("broken", "pdf", fail)
+        self.assertEqual(os.listdir(self.folder), ["big.pdf"])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ExportCache(self.folder, max_bytes=250)
+        for name in ("k1", "k2"):
+            cache.store_bytes(name, "csv", b"x" * 100)
+            time.sleep(0.01)
+
+        # Reading k1 makes k2 the least recently used
+        cache.get("k1", "csv")
+        time.sleep(0.01)
+        cache.store_bytes("k3", "csv", b"x" * 100)
+
+        self.assertEqual(sorted(os.listdir(self.folder)), ["k1.csv", "k3.csv"])
+
+
+if __name__ == "__main__":
+    unittest.main()
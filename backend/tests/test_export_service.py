@@ -0,0 +1,123 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import PyPDF2
+from reportlab.platypus import Paragraph
+
+from services.export_service import (
+    PDF_CLIPPED_MARKER,
+    PDF_ROW_HEIGHT,
+    _pdf_cell,
+    export_info,
+    export_projection,
+    export_row,
+    iter_json,
+    restamp_json,
+    write_pdf,
+)
+
+
+class ExportServiceTestCase(unittest.TestCase):
+    def test_projection_is_none_without_categories(self):
+        self.assertIsNone(export_projection([]))
+        self.assertIsNone(export_projection(None))
+
+    def test_projection_fetches_only_selected_fields(self):
+        projection = export_projection(["sleep", "vital_signs"])
+        self.assertEqual(
+            projection,
+            {"_id": 0, "date": 1, "note": 1, "sleepHours": 1, "vital_bpm": 1},
+        )
+
+    def test_projected_document_exports_like_full_document(self):
+        log = {
+            "_id": "abc",
+            "user_id": "u1",
+            "date": "11-02-2025",
+            "log_date": "2025-11-02",
+            "sleepHours": 7,
+            "mood": 4,
+            "note": "ok",
+        }
+        categories = ["sleep"]
+        projected = {field: log[field] for field in export_projection(categories) if field in log}
+
+        self.assertEqual(export_row(projected, categories), export_row(log, categories))
+
+    def test_row_keeps_selected_categories_in_column_order(self):
+        log = {
+            "date": "11-02-2025",
+            "vital_bpm": 70,
+            "symptom": "",
+            "tookMedication": False,
+            "mood": 0,
+            "sleepHours": None,
+            "note": "",
+        }
+        row = export_row(log, ["vital_signs", "symptoms", "medications", "mood", "sleep"])
+
+        self.assertEqual(list(row), ["date", "mood", "tookMedication", "vital_bpm"])
+        self.assertEqual(row, {"date": "11-02-2025", "mood": 0, "tookMedication": False, "vital_bpm": 70})
+
+    def test_long_pdf_cell_wraps_instead_of_truncating(self):
+        note = "Felt dizzy after lunch, " * 10
+        cell, height = _pdf_cell(note, 100)
+
+        self.assertIsInstance(cell, Paragraph)
+        self.assertIn(note.strip(), cell.getPlainText())
+        self.assertGreater(height, PDF_ROW_HEIGHT)
+        self.assertEqual(_pdf_cell("short", 100), ("short", PDF_ROW_HEIGHT))
+
+    def test_pdf_cell_taller_than_a_page_is_clipped_with_marker(self):
+        note = "Kept a detailed diary of every symptom today. " * 400
+        cell, height = _pdf_cell(note, 100, 300)
+
+        self.assertLessEqual(height, 300)
+        self.assertTrue(cell.getPlainText().endswith(PDF_CLIPPED_MARKER))
+        self.assertTrue(note.startswith(cell.getPlainText()[: -len(PDF_CLIPPED_MARKER)]))
+
+    def test_pdf_rows_never_run_past_the_page(self):
+        logs = [{"date": "11-02-2025", "mood": 3, "note": "Very long note. " * 2000}] * 3
+        output = io.BytesIO()
+        write_pdf(output, logs, ["mood"], len(logs))
+
+        output.seek(0)
+        pages = [page.extract_text() for page in PyPDF2.PdfReader(output).pages]
+        # Each clipped note ends, marker included, on the page it starts on
+        self.assertEqual(sum(text.count(PDF_CLIPPED_MARKER.strip()) for text in pages), 3)
+        for text in pages:
+            if "Very long note" in text:
+                self.assertIn(PDF_CLIPPED_MARKER.strip(), text)
+
+    def test_pdf_with_wrapped_rows_spans_pages(self):
+        logs = [
+            {"date": f"11-{day:02d}-2025", "mood": 3, "note": "Long note about the day. " * 8}
+            for day in range(1, 29)
+        ]
+        output = io.BytesIO()
+        write_pdf(output, logs, ["mood"], len(logs))
+
+        self.assertTrue(output.getvalue().startswith(b"%PDF"))
+        self.assertGreater(output.getvalue().count(b"/Type /Page\n"), 1)
+
+    def test_restamp_json_replaces_only_generated_at(self):
+        logs = [{"date": "11-02-2025", "mood": 3}]
+        fd, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter_json(logs, ["mood"], export_info(["mood"], None, None, 1)):
+                f.write(chunk)
+        try:
+            served = json.loads(b"".join(restamp_json(path, datetime(2031, 1, 2, 3, 4, 5))))
+        finally:
+            os.remove(path)
+
+        self.assertEqual(served["export_info"]["generated_at"], "2031-01-02T03:04:05")
+        self.assertEqual(served["data"], [{"date": "11-02-2025", "mood": 3}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
+import asyncio
 import os
+import threading
+import time
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
-from services.gemini_service import GeminiService
+from google.api_core import exceptions as google_exceptions
+
+from services.gemini_service import GeminiLimiter, GeminiService, GeminiTimeout, GeminiUnavailable
 
 
 class GeminiServiceTestCase(unittest.TestCase):
@@ -43,3 +48,231 @@ class GeminiServiceTestCase(unittest.TestCase):
         """
         with self.assertRaises(ValueError):
             GeminiService()
+
+
+class GeminiLimiterTestCase(unittest.TestCase):
+    def test_retries_transient_errors(self):
+        limiter = GeminiLimiter(retries=2, backoff=0)
+        fn = MagicMock(side_effect=[google_exceptions.ServiceUnavailable("down"), "ok"])
+
+        self.assertEqual(limiter.call(fn, "hi"), "ok")
+        self.assertEqual(fn.call_count, 2)
+        self.assertEqual(limiter.metrics()["retries"], 1)
+        self.assertEqual(limiter.metrics()["state"], "closed")
+
+    def test_does_not_retry_other_errors(self):
+        limiter = GeminiLimiter(retries=2, backoff=0)
+        fn = MagicMock(side_effect=ValueError("bad request"))
+
+        with self.assertRaises(ValueError):
+            limiter.call(fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_times_out_slow_calls(self):
+        limiter = GeminiLimiter(timeout=0.05, retries=0)
+        release = threading.Event()
+
+        with self.assertRaises(GeminiTimeout):
+            limiter.call(release.wait, 2)
+        self.assertEqual(limiter.metrics()["timeouts"], 1)
+        # The abandoned call still holds its slot until it finishes
+        self.assertEqual(limiter.metrics()["in_flight"], 1)
+
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(limiter.metrics()["in_flight"], 0)
+
+    def test_rejects_when_no_slot_frees_up_in_time(self):
+        limiter = GeminiLimiter(max_concurrency=1, queue_timeout=0.05, timeout=2, retries=0)
+        release = threading.Event()
+        worker = threading.Thread(target=limiter.call, args=(release.wait, 2))
+        worker.start()
+        time.sleep(0.05)
+
+        try:
+            with self.assertRaises(GeminiUnavailable):
+                limiter.call(lambda: "late")
+            self.assertEqual(limiter.metrics()["rejected_deadline"], 1)
+        finally:
+            release.set()
+            worker.join()
+
+    def test_rejects_when_queue_is_full(self):
+        limiter = GeminiLimiter(max_concurrency=1, max_queue=0, timeout=2, retries=0)
+        release = threading.Event()
+        worker = threading.Thread(target=limiter.call, args=(release.wait, 2))
+        worker.start()
+        time.sleep(0.05)
+
+        try:
+            with self.assertRaises(GeminiUnavailable):
+                limiter.call(lambda: "queued")
+            self.assertEqual(limiter.metrics()["rejected_queue_full"], 1)
+        finally:
+            release.set()
+            worker.join()
+
+    def test_circuit_opens_then_recovers(self):
+        limiter = GeminiLimiter(retries=0, failure_threshold=2, cooldown=0.1)
+        failing = MagicMock(side_effect=google_exceptions.ServiceUnavailable("down"))
+
+        for _ in range(2):
+            with self.assertRaises(google_exceptions.ServiceUnavailable):
+                limiter.call(failing)
+        self.assertEqual(limiter.metrics()["state"], "open")
+
+        # Fails fast without calling the model
+        healthy = MagicMock(return_value="ok")
+        with self.assertRaises(GeminiUnavailable):
+            limiter.call(healthy)
+        healthy.assert_not_called()
+
+        # After the cooldown a trial call closes the circuit again
+        time.sleep(0.15)
+        self.assertEqual(limiter.call(healthy), "ok")
+        self.assertEqual(limiter.metrics()["state"], "closed")
+
+    def test_stream_stops_at_deadline(self):
+        limiter = GeminiLimiter(timeout=0.1, retries=0)
+        release = threading.Event()
+        closed = threading.Event()
+
+        def stalls_after_first_chunk():
+            try:
+                yield "Rest "
+                release.wait(2)
+                yield "late"
+                yield "later"
+            finally:
+                closed.set()
+
+        chunks = []
+        with self.assertRaises(GeminiTimeout):
+            for chunk in limiter.stream(stalls_after_first_chunk):
+                chunks.append(chunk)
+
+        self.assertEqual(chunks, ["Rest "])
+        self.assertEqual(limiter.metrics()["timeouts"], 1)
+        # The upstream read still running holds its slot until it returns
+        self.assertEqual(limiter.metrics()["in_flight"], 1)
+
+        release.set()
+        self.assertTrue(closed.wait(1))
+        time.sleep(0.05)
+        self.assertEqual(limiter.metrics()["in_flight"], 0)
+
+    def test_stream_closed_early_closes_upstream_and_releases_slot(self):
+        limiter = GeminiLimiter(timeout=2, retries=0)
+        closed = threading.Event()
+
+        def endless():
+            try:
+                while True:
+                    yield "chunk"
+                    time.sleep(0.01)
+            finally:
+                closed.set()
+
+        stream = limiter.stream(endless)
+        self.assertEqual(next(stream), "chunk")
+        stream.close()
+
+        self.assertTrue(closed.wait(1))
+        time.sleep(0.05)
+        self.assertEqual(limiter.metrics()["in_flight"], 0)
+
+    @patch.dict(os.environ, {"GEMINI_API_KEY": "fake-key"}, clear=True)
+    @patch("services.gemini_service.genai.GenerativeModel")
+    def test_chat_stream_reports_timeout_as_error_text(self, MockModel):
+        def slow_stream(*args, **kwargs):
+            yield MagicMock(text="Drink ")
+            time.sleep(0.5)
+            yield MagicMock(text="water")
+
+        MockModel.return_value.generate_content.side_effect = slow_stream
+
+        svc = GeminiService()
+        svc.limiter = GeminiLimiter(timeout=0.1, retries=0)
+        chunks = list(svc.chat_stream("hi"))
+
+        self.assertEqual(chunks[0], "Drink ")
+        self.assertTrue(chunks[-1].startswith("Error:"))
+        self.assertEqual(svc.limiter.metrics()["timeouts"], 1)
+
+    @patch.dict(os.environ, {"GEMINI_API_KEY": "fake-key"}, clear=True)
+    @patch("services.gemini_service.genai.GenerativeModel")
+    def test_chat_reports_open_circuit_as_error_text(self, MockModel):
+        MockModel.return_value.generate_content.side_effect = google_exceptions.ServiceUnavailable("down")
+
+        svc = GeminiService()
+        svc.limiter = GeminiLimiter(retries=0, failure_threshold=1, cooldown=60)
+        svc.chat("hi")
+        out = svc.chat("hi again")
+
+        self.assertTrue(out.startswith("Error:"))
+        self.assertEqual(MockModel.return_value.generate_content.call_count, 1)
+
+
+class GeminiAsyncTestCase(unittest.TestCase):
+    @patch.dict(os.environ, {"GEMINI_API_KEY": "fake-key"}, clear=True)
+    @patch("services.gemini_service.genai.GenerativeModel")
+    def test_achat_returns_text(self, MockModel):
+        mock_response = MagicMock()
+        mock_response.text = "async hello"
+        MockModel.return_value.generate_content_async = AsyncMock(return_value=mock_response)
+
+        svc = GeminiService()
+        out = asyncio.run(svc.achat("hi"))
+
+        MockModel.return_value.generate_content_async.assert_awaited_once_with("hi")
+        self.assertEqual(out, "async hello")
+
+    @patch.dict(os.environ, {"GEMINI_API_KEY": "fake-key"}, clear=True)
+    @patch("services.gemini_service.genai.GenerativeModel")
+    def test_batch_runs_prompts_concurrently(self, MockModel):
+        async def slow_generate(prompt):
+            await asyncio.sleep(0.2)
+            if prompt == "bad":
+                raise ValueError("blocked")
+            response = MagicMock()
+            response.text = prompt.upper()
+            return response
+
+        MockModel.return_value.generate_content_async = slow_generate
+
+        svc = GeminiService()
+        started = time.monotonic()
+        out = svc.batch(["a", "bad", "c"])
+        elapsed = time.monotonic() - started
+
+        # Replies keep prompt order; one failure doesn't sink the others
+        self.assertEqual(out[0], "A")
+        self.assertTrue(out[1].startswith("Error:"))
+        self.assertEqual(out[2], "C")
+        self.assertLess(elapsed, 0.5)
+
+    def test_cancelled_wait_for_slot_does_not_leak_it(self):
+        limiter = GeminiLimiter(max_concurrency=1, queue_timeout=2, timeout=2, retries=0)
+        release = threading.Event()
+        holder = threading.Thread(target=limiter.call, args=(release.wait, 2))
+        holder.start()
+        time.sleep(0.05)
+
+        async def ok():
+            return "ok"
+
+        async def cancel_while_waiting():
+            task = asyncio.ensure_future(limiter.acall(ok))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The slot frees up while the cancelled wait is still going
+            release.set()
+            await asyncio.sleep(0.1)
+
+        asyncio.run(cancel_while_waiting())
+        holder.join()
+
+        self.assertEqual(limiter.metrics()["in_flight"], 0)
+        self.assertEqual(limiter.call(lambda: "next"), "next")
@@ -159,6 +159,55 @@ class GraphVisualizationTestCase(unittest.TestCase):
         # but it should NOT be 400.
         self.assertNotEqual(response.status_code, 400)
 
+    # 7) Aggregate endpoint rejects unknown resolutions
+    def test_graph_aggregate_invalid_resolution(self):
+        response = self.client.get(
+            "/api/health-logs/aggregate?resolution=decade&user_id=graph-test-user"
+        )
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertIn("error", data)
+
+    # 8) Monthly aggregate returns one bucket with per-metric means and counts
+    def test_graph_aggregate_monthly_buckets(self):
+        """
+        Logs in the same month should collapse into one bucket whose
+        means and counts are computed on the server.
+        """
+        user_id = "graph-aggregate-user"
+        self.seed_log(date_iso="2031-03-02", user_id=user_id, sleepHours=6, tookMedication=True)
+        self.seed_log(date_iso="2031-03-20", user_id=user_id, sleepHours=8, tookMedication=False)
+
+        response = self.client.get(
+            f"/api/health-logs/aggregate?resolution=month&start=2031-03-01&end=2031-03-31&user_id={user_id}"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(data["resolution"], "month")
+        self.assertEqual(len(data["buckets"]), 1)
+
+        bucket = data["buckets"][0]
+        self.assertEqual(bucket["bucket"], "2031-03-01")
+        self.assertEqual(bucket["log_count"], 2)
+        self.assertAlmostEqual(bucket["means"]["sleepHours"], 7.0)
+        self.assertAlmostEqual(bucket["means"]["tookMedication"], 0.5)
+        self.assertEqual(bucket["counts"]["sleepHours"], 2)
+
+    # 9) Weekly buckets start on Sunday, like the Graph view
+    def test_graph_aggregate_weekly_starts_on_sunday(self):
+        user_id = "graph-aggregate-week-user"
+        # 2031-03-05 is a Wednesday; its week starts Sunday 2031-03-02
+        self.seed_log(date_iso="2031-03-05", user_id=user_id)
+
+        response = self.client.get(
+            f"/api/health-logs/aggregate?resolution=week&start=2031-03-01&end=2031-03-08&user_id={user_id}"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(data["buckets"][0]["bucket"], "2031-03-02")
+
 
 if __name__ == "__main__":
     unittest.main()
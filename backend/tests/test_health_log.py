@@ -103,6 +103,8 @@ class HealthLogsApiTestCase(unittest.TestCase):
         self.assertEqual(doc.get("mood"), 4)
         self.assertEqual(doc.get("symptom"), "headache")
         self.assertEqual(doc.get("note"), "Test note from unit test")
+        # Indexed ISO date used by range queries
+        self.assertEqual(doc.get("log_date"), date_iso)
 
         # Second save to test "update" behavior
         payload_update = {
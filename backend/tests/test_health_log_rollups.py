@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime
+
+from services.health_log_service import (
+    bucket_start,
+    format_bucket,
+    rollup_increments,
+    rollup_range_filter,
+)
+
+
+class HealthLogRollupsTestCase(unittest.TestCase):
+    def test_bucket_start_week_begins_on_sunday(self):
+        wednesday = datetime(2031, 3, 5)
+        sunday = datetime(2031, 3, 2)
+        self.assertEqual(bucket_start(wednesday, "week"), "2031-03-02")
+        self.assertEqual(bucket_start(sunday, "week"), "2031-03-02")
+
+    def test_bucket_start_month_and_year(self):
+        day = datetime(2031, 3, 5)
+        self.assertEqual(bucket_start(day, "month"), "2031-03-01")
+        self.assertEqual(bucket_start(day, "year"), "2031-01-01")
+
+    def test_increments_for_new_log(self):
+        current = {"sleepHours": 7, "mood": 4, "tookMedication": True, "vital_bpm": None}
+        inc = rollup_increments(None, current)
+
+        self.assertEqual(inc["log_count"], 1)
+        self.assertEqual(inc["sums.sleepHours"], 7)
+        self.assertEqual(inc["counts.sleepHours"], 1)
+        self.assertEqual(inc["sums.tookMedication"], 1)
+        self.assertEqual(inc["counts.vital_bpm"], 0)
+
+    def test_increments_for_updated_log_apply_only_the_delta(self):
+        previous = {"log_date": "2031-03-05", "sleepHours": 7, "mood": 4, "tookMedication": True}
+        current = {"sleepHours": 5, "mood": None, "tookMedication": False}
+        inc = rollup_increments(previous, current)
+
+        self.assertEqual(inc["log_count"], 0)
+        self.assertEqual(inc["sums.sleepHours"], -2)
+        self.assertEqual(inc["counts.sleepHours"], 0)
+        self.assertEqual(inc["sums.mood"], -4)
+        self.assertEqual(inc["counts.mood"], -1)
+        self.assertEqual(inc["sums.tookMedication"], -1)
+        self.assertEqual(inc["counts.tookMedication"], 0)
+
+    def test_increments_treat_legacy_log_without_log_date_as_new(self):
+        previous = {"sleepHours": 7}
+        inc = rollup_increments(previous, {"sleepHours": 7})
+
+        self.assertEqual(inc["log_count"], 1)
+        self.assertEqual(inc["sums.sleepHours"], 7)
+
+    def test_range_filter_includes_bucket_containing_start(self):
+        query = rollup_range_filter("u", "month", "2031-03-15", "2031-05-10")
+        self.assertEqual(query["bucket"], {"$gte": "2031-03-01", "$lte": "2031-05-10"})
+
+    def test_format_bucket_computes_means(self):
+        row = {
+            "bucket": "2031-03-01",
+            "log_count": 2,
+            "sums": {"sleepHours": 13, "vital_bpm": 0, "mood": 0, "tookMedication": 1},
+            "counts": {"sleepHours": 2, "vital_bpm": 0, "mood": 0, "tookMedication": 2},
+        }
+        out = format_bucket(row)
+
+        self.assertEqual(out["means"]["sleepHours"], 6.5)
+        self.assertEqual(out["means"]["tookMedication"], 0.5)
+        self.assertIsNone(out["means"]["vital_bpm"])
+
+
+if __name__ == "__main__":
+    unittest.main()
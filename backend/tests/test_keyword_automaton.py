@@ -0,0 +1,27 @@
+import unittest
+
+from app import ResponseFilter
+from services.keyword_service import KeywordAutomaton
+
+
+class KeywordAutomatonTestCase(unittest.TestCase):
+    def test_finds_overlapping_and_nested_keywords(self):
+        automaton = KeywordAutomaton({"A": ["he", "hers"], "B": ["she"], "C": ["his"]})
+        self.assertEqual(automaton.find("ushers"), {"A", "B"})
+        self.assertEqual(automaton.find("this"), {"C"})
+        self.assertEqual(automaton.find("nothing here"), {"A"})
+        self.assertEqual(automaton.find(""), set())
+
+    def test_matches_after_a_failed_partial_keyword(self):
+        automaton = KeywordAutomaton({"VITALS": ["blood pressure"], "LAB": ["blood work"]})
+        self.assertEqual(automaton.find("blood pblood work"), {"LAB"})
+
+    def test_response_filter_keeps_category_priority(self):
+        # "pain" (SYMPTOM) outranks "test" (TEST_RESULT) and "urgent" (EMERGENCY)
+        self.assertEqual(ResponseFilter.scan("Urgent: test for back pain"), ("SYMPTOM", False))
+        self.assertEqual(ResponseFilter.scan("Can't breathe after my dosage"), ("MEDICATION", True))
+        self.assertEqual(ResponseFilter.scan("How do I sleep better?"), ("GENERAL", False))
+
+
+if __name__ == "__main__":
+    unittest.main()
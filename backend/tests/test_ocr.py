@@ -0,0 +1,222 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw
+
+import app as app_module
+from app import create_app
+from services import ocr_service
+from services.ocr_service import OCRBusy, OCRExecutor, extract_image_text, extract_pdf_text, preprocess_image
+from services.prescription_service import PrescriptionPipeline
+
+
+def shout(text):
+    return text.upper()
+
+
+class OCRExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = OCRExecutor(max_workers=1, max_queue=0)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_runs_job_in_pool_and_records_timing(self):
+        result, timing = self.executor.run(shout, "metformin")
+
+        self.assertEqual(result, "METFORMIN")
+        self.assertEqual(timing["kind"], "shout")
+        self.assertGreaterEqual(timing["run_seconds"], 0)
+        stats = self.executor.stats()
+        self.assertEqual(stats["jobs"], 1)
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["recent"], [timing])
+
+    def test_pool_workers_are_not_forked(self):
+        self.executor.run(shout, "")
+
+        self.assertNotEqual(self.executor._pool._mp_context.get_start_method(), "fork")
+
+    def test_rejects_when_saturated(self):
+        worker = threading.Thread(target=self.executor.run, args=(time.sleep, 0.5))
+        worker.start()
+        time.sleep(0.1)
+
+        try:
+            with self.assertRaises(OCRBusy) as ctx:
+                self.executor.run(shout, "late")
+            self.assertGreaterEqual(ctx.exception.retry_after, 1)
+            self.assertEqual(self.executor.stats()["rejected"], 1)
+        finally:
+            worker.join()
+
+        # A slot frees up once the running job finishes
+        self.assertEqual(self.executor.run(shout, "ok")[0], "OK")
+
+
+class PreprocessImageTestCase(unittest.TestCase):
+    def photo(self):
+        # A phone-sized colour photo, stored sideways with EXIF orientation 6,
+        # of a light page with a dark line of "text" near the top
+        image = Image.new("RGB", (4000, 3000), (200, 190, 170))
+        ImageDraw.Draw(image).rectangle((500, 2500, 3500, 2560), fill=(20, 20, 20))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", exif=exif)
+        buffer.seek(0)
+        return Image.open(buffer)
+
+    def test_none_profile_leaves_image_alone(self):
+        photo = self.photo()
+        self.assertEqual(preprocess_image(photo, "none").size, (4000, 3000))
+
+    def test_scan_profile_fixes_orientation_and_downscales(self):
+        prepared = preprocess_image(self.photo(), "scan")
+
+        self.assertEqual(prepared.mode, "L")
+        # Upright (portrait) and no larger than a letter page at 300 DPI
+        self.assertGreater(prepared.height, prepared.width)
+        self.assertLessEqual(max(prepared.size), 300 * 11)
+
+    def test_photo_profile_binarizes_and_crops_to_text(self):
+        prepared = preprocess_image(self.photo(), "photo")
+
+        self.assertEqual(set(prepared.getdata()) - {0, 255}, set())
+        # Cropped close to the dark line, not the whole page
+        self.assertLess(prepared.width, 300)
+        self.assertGreater(prepared.height, 2000)
+
+    def test_extract_image_text_reports_profile(self):
+        fd, path = tempfile.mkstemp(suffix=".jpg")
+        os.close(fd)
+        try:
+            self.photo().save(path)
+            with patch.object(ocr_service, "ocr_image", return_value="Lisinopril 10 mg") as ocr:
+                text, pages = extract_image_text(path, profile="scan")
+        finally:
+            os.remove(path)
+
+        self.assertEqual(text, "Lisinopril 10 mg")
+        self.assertEqual(ocr.call_args.args[0].mode, "L")
+        self.assertEqual(pages[0]["profile"], "scan")
+        self.assertIn("preprocess_seconds", pages[0])
+
+    def test_unknown_profile_is_an_error_not_empty_text(self):
+        with self.assertRaises(ValueError):
+            extract_image_text("missing.jpg", profile="fancy")
+
+    def test_unknown_configured_profile_fails_at_import(self):
+        result = subprocess.run(
+            [sys.executable, "-c", "import services.ocr_service"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env={**os.environ, "OCR_IMAGE_PROFILE": "fancy"},
+            capture_output=True,
+            text=True,
+        )
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("Unknown OCR image profile: fancy", result.stderr)
+
+
+@unittest.skipIf(ocr_service.pymupdf is None, "PyMuPDF not installed")
+class HybridPDFExtractionTestCase(unittest.TestCase):
+    def setUp(self):
+        # Page 1 has a text layer, page 2 is blank like a scan
+        doc = ocr_service.pymupdf.open()
+        doc.new_page().insert_text((72, 72), "Lisinopril 10 mg once daily with water")
+        doc.new_page()
+        fd, self.path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        doc.save(self.path)
+        doc.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_ocr_only_pages_without_text_layer(self):
+        with patch.object(ocr_service, "ocr_image", return_value="Metformin 500 mg") as ocr:
+            text, pages = extract_pdf_text(self.path)
+
+        self.assertEqual(ocr.call_count, 1)
+        self.assertIn("Lisinopril 10 mg", text)
+        self.assertIn("Metformin 500 mg", text)
+        self.assertEqual([page["method"] for page in pages], ["text", "ocr"])
+        self.assertEqual(pages[1]["chars"], len("Metformin 500 mg"))
+        self.assertTrue(all("seconds" in page for page in pages))
+
+    def test_unreadable_pdf_returns_no_pages(self):
+        with open(self.path, "wb") as f:
+            f.write(b"%PDF-1.4 broken")
+
+        self.assertEqual(extract_pdf_text(self.path), ("", []))
+
+
+class UploadOCRBusyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+        # Keep uploaded files out of the source tree
+        self.upload_folder = app_module.UPLOAD_FOLDER
+        app_module.UPLOAD_FOLDER = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(app_module.UPLOAD_FOLDER, ignore_errors=True)
+        app_module.UPLOAD_FOLDER = self.upload_folder
+
+    def test_upload_returns_429_with_retry_after_when_pool_is_full(self):
+        with patch.object(PrescriptionPipeline, "submit", side_effect=OCRBusy(retry_after=7)):
+            resp = self.client.post(
+                "/api/prescription/upload",
+                # Unique content, so no earlier upload's results are reused
+                data={"file": (io.BytesIO(f"fakepng {uuid.uuid4()}".encode()), "busy.png"), "user_id": "ocr-busy"},
+                content_type="multipart/form-data",
+            )
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers["Retry-After"], "7")
+        self.assertIn("error", resp.get_json())
+
+    def upload(self, content, user_id):
+        return self.client.post(
+            "/api/prescription/upload",
+            data={"file": (io.BytesIO(content), "busy.png"), "user_id": user_id},
+            content_type="multipart/form-data",
+        )
+
+    def test_rejected_upload_keeps_its_file_for_the_retry(self):
+        content = f"fakepng {uuid.uuid4()}".encode()
+        with patch.object(PrescriptionPipeline, "submit", side_effect=OCRBusy(retry_after=7)):
+            self.assertEqual(self.upload(content, "ocr-busy-a").status_code, 429)
+        stored = os.listdir(app_module.UPLOAD_FOLDER)
+        self.assertEqual(len(stored), 1)
+
+        with patch.object(PrescriptionPipeline, "submit"):
+            queued = self.upload(content, "ocr-busy-a")
+        self.assertEqual(queued.status_code, 202)
+        path = self.client.get(f"/api/prescription/{queued.get_json()['prescription_id']}").get_json()["filepath"]
+        self.assertEqual(os.path.basename(path), stored[0])
+        self.assertTrue(os.path.exists(path))
+
+    def test_ocr_stats(self):
+        resp = self.client.get("/api/ocr/stats")
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.get_json()
+        self.assertIn("workers", body)
+        self.assertIn("pending", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
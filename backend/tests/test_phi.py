@@ -0,0 +1,47 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from services.phi_service import anonymize, anonymize_batch
+
+
+class PHIAnonymizerTestCase(unittest.TestCase):
+    def test_text_without_phi_is_unchanged(self):
+        text = "How can I treat a common cold?"
+        self.assertEqual(anonymize(text), (text, {}))
+
+    def test_tokens_are_numbered_per_category(self):
+        text = "My name is John Smith, call 123-456-7890 or 555-987-6543, SSN 123-45-6789"
+        anonymized, replacements = anonymize(text)
+
+        self.assertEqual(anonymized, "[NAME_0], call [PHONE_0] or [PHONE_1], SSN [SSN_0]")
+        self.assertEqual(
+            replacements,
+            {"[NAME_0]": "name", "[PHONE_0]": "phone", "[PHONE_1]": "phone", "[SSN_0]": "ssn"},
+        )
+
+    def test_matched_span_is_replaced_not_first_occurrence(self):
+        # The order number contains the SSN's digits but is not itself a match
+        anonymized, _ = anonymize("order x123-45-6789, ssn 123-45-6789")
+        self.assertEqual(anonymized, "order x123-45-6789, ssn [SSN_0]")
+
+    def test_overlapping_spans_use_the_earlier_category(self):
+        # 123-45-6789 is an SSN; the phone pattern must not also claim digits in it
+        anonymized, replacements = anonymize("ssn 123-45-6789 end")
+        self.assertEqual(anonymized, "ssn [SSN_0] end")
+        self.assertEqual(replacements, {"[SSN_0]": "ssn"})
+
+
+class PHIBatchTestCase(unittest.TestCase):
+    TEXTS = ["my name is Ann Lee", "no phi here", "ssn 123-45-6789"] * 7
+
+    def test_batch_matches_single_calls_in_order(self):
+        expected = [anonymize(text) for text in self.TEXTS]
+        self.assertEqual(list(anonymize_batch(self.TEXTS, chunk_size=4)), expected)
+
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            results = list(anonymize_batch(iter(self.TEXTS), pool, chunk_size=4, max_pending=2))
+        self.assertEqual(results, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from app import create_app
+
+
+class PHIBatchApiTestCase(unittest.TestCase):
+    def test_batch_endpoint(self):
+        client = create_app().test_client()
+
+        resp = client.post("/api/phi/anonymize-batch", json={"texts": ["ssn 123-45-6789", "hello"]})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(data["results"][0], {"anonymized": "ssn [SSN_0]", "replacements": {"[SSN_0]": "ssn"}})
+        self.assertEqual(data["results"][1], {"anonymized": "hello", "replacements": {}})
+
+        resp = client.post("/api/phi/anonymize-batch", json={"texts": "not a list"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_large_batch_runs_in_worker_processes(self):
+        client = create_app().test_client()
+        texts = ["ssn 123-45-6789", "hello"] * 600
+
+        resp = client.post("/api/phi/anonymize-batch", json={"texts": texts})
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()["results"]
+        self.assertEqual(len(results), 1200)
+        self.assertEqual(results[-2]["anonymized"], "ssn [SSN_0]")
+        self.assertEqual(results[-1]["anonymized"], "hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from pymongo import MongoClient
+
+from services import ocr_service
+from services.ocr_service import OCRBusy, extract_pdf_text
+from services.prescription_service import PrescriptionPipeline, new_stages
+from services.worker_service import current_worker
+
+
+class FakeOCR:
+    def __init__(self, busy_times=0):
+        self.busy_times = busy_times
+        self.jobs = []
+
+    def run(self, fn, *args):
+        self.jobs.append((fn.__name__, *args))
+        if self.busy_times:
+            self.busy_times -= 1
+            raise OCRBusy(retry_after=0)
+        return fn(*args), {"queue_seconds": 0.0, "run_seconds": 0.01}
+
+    def retry_after(self):
+        return 3
+
+
+class PrescriptionPipelineTestCase(unittest.TestCase):
+    def make_pipeline(self, ocr=None, explain=None, **kwargs):
+        self.collection = MagicMock()
+        return PrescriptionPipeline(
+            self.collection,
+            ocr or FakeOCR(),
+            parse=lambda text: {"medications": [{"name": text, "dosage": "10 mg"}], "warnings": []},
+            explain=explain or (lambda text, meds: f"about {text}"),
+            **kwargs,
+        )
+
+    def updates(self):
+        merged = {}
+        for call in self.collection.update_one.call_args_list:
+            merged.update(call.args[1]["$set"])
+        return merged
+
+    def test_runs_every_stage_and_stores_results(self):
+        pipeline = self.make_pipeline(ocr=FakeOCR(busy_times=1))
+        pipeline.submit("rx1", "scan.png", lambda path: ("Lisinopril", []))
+        pipeline.executor.shutdown(wait=True)
+
+        fields = self.updates()
+        self.assertEqual(fields["status"], "completed")
+        self.assertEqual(fields["extracted_text"], "Lisinopril")
+        self.assertEqual(fields["medications"], [{"name": "Lisinopril", "dosage": "10 mg"}])
+        self.assertEqual(fields["ai_explanation"], "about Lisinopril")
+        for stage in new_stages():
+            self.assertEqual(fields[f"stages.{stage}.status"], "done")
+            self.assertIn(f"stages.{stage}.seconds", fields)
+
+    def test_failed_stage_stops_the_pipeline(self):
+        def explain(text, meds):
+            raise RuntimeError("model down")
+
+        pipeline = self.make_pipeline(explain=explain)
+        pipeline.submit("rx2", "scan.png", lambda path: ("Metformin", []))
+        pipeline.executor.shutdown(wait=True)
+
+        fields = self.updates()
+        self.assertEqual(fields["status"], "failed")
+        self.assertEqual(fields["stages.parsing.status"], "done")
+        self.assertEqual(fields["stages.explanation.status"], "failed")
+        self.assertEqual(fields["stages.explanation.error"], "model down")
+
+    @unittest.skipIf(ocr_service.pymupdf is None, "PyMuPDF not installed")
+    def test_pdf_text_layer_is_read_here_and_each_scanned_page_is_an_ocr_job(self):
+        doc = ocr_service.pymupdf.open()
+        doc.new_page().insert_text((72, 72), "Lisinopril 10 mg once daily with water")
+        doc.new_page()
+        doc.new_page()
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        path = os.path.join(folder, "scan.pdf")
+        doc.save(path)
+        doc.close()
+
+        ocr = FakeOCR(busy_times=1)
+        pipeline = self.make_pipeline(ocr=ocr)
+        with patch.object(ocr_service, "ocr_image", return_value="Metformin 500 mg"):
+            pipeline.submit("rx5", path, extract_pdf_text)
+            pipeline.executor.shutdown(wait=True)
+
+        # Page 1 never reaches the pool; the busy retry repeats one page's job
+        self.assertEqual(set(ocr.jobs), {("ocr_pdf_page", path, 2), ("ocr_pdf_page", path, 3)})
+        fields = self.updates()
+        self.assertEqual(fields["status"], "completed")
+        self.assertEqual([page["method"] for page in fields["ocr_timing"]["pages"]], ["text", "ocr", "ocr"])
+        self.assertEqual(fields["extracted_text"].count("Metformin 500 mg"), 2)
+
+    def test_database_error_between_stages_marks_it_failed(self):
+        pipeline = self.make_pipeline()
+        self.collection.update_one.side_effect = [ConnectionError("primary stepped down"), None]
+        pipeline.submit("rx4", "scan.png", lambda path: ("Aspirin", []))
+        pipeline.executor.shutdown(wait=True)
+
+        self.assertEqual(self.updates(), {"status": "failed", "error": "primary stepped down"})
+
+    def test_submit_rejects_past_max_pending(self):
+        pipeline = self.make_pipeline(max_workers=1, max_pending=1)
+        pipeline._slots.acquire()  # one job already pending
+
+        with self.assertRaises(OCRBusy) as ctx:
+            pipeline.submit("rx3", "scan.png", lambda path: ("", []))
+        self.assertEqual(ctx.exception.retry_after, 3)
+
+
+class PrescriptionRecoveryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.collection = MongoClient(os.getenv("MONGODB_URI"))["baymax"].prescriptions
+        self.pipeline = PrescriptionPipeline(
+            self.collection,
+            FakeOCR(),
+            parse=lambda text: {"medications": [], "warnings": []},
+            explain=lambda text, meds: "",
+            stale_seconds=900,
+        )
+        self.ids = []
+
+    def tearDown(self):
+        self.pipeline.executor.shutdown(wait=True)
+        self.collection.delete_many({"_id": {"$in": self.ids}})
+
+    def insert(self, **fields):
+        doc = {"_id": uuid.uuid4().hex, "filepath": "missing.png", "stages": new_stages(), **fields}
+        self.collection.insert_one(doc)
+        self.ids.append(doc["_id"])
+        return doc["_id"]
+
+    def test_requeues_docs_left_by_exited_or_stale_workers(self):
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        host = current_worker().rpartition(":")[0]
+        now = datetime.now()
+
+        exited_id = self.insert(status="processing", worker=f"{host}:{exited.pid}", queued_at=now)
+        stale_id = self.insert(status="pending", worker=current_worker(), queued_at=now - timedelta(hours=1))
+        live_id = self.insert(status="pending", worker=current_worker(), queued_at=now)
+        again_id = self.insert(
+            status="processing", worker=f"{host}:{exited.pid}", queued_at=now, recovered_at=now,
+        )
+
+        self.assertEqual(self.pipeline.recover(), (2, 1))
+        self.pipeline.executor.shutdown(wait=True)
+
+        docs = {key: self.collection.find_one({"_id": key}) for key in (exited_id, stale_id, live_id, again_id)}
+        self.assertEqual(docs[exited_id]["worker"], current_worker())
+        self.assertEqual(docs[exited_id]["status"], "completed")
+        self.assertEqual(docs[stale_id]["status"], "completed")
+        self.assertEqual(docs[live_id]["status"], "pending")
+        self.assertNotIn("recovered_at", docs[live_id])
+        self.assertEqual(docs[again_id]["status"], "failed")
+
+    def test_fails_docs_it_cannot_queue(self):
+        doc_id = self.insert(status="pending", worker=current_worker(), queued_at=datetime.now() - timedelta(hours=1))
+        self.pipeline._slots = MagicMock(acquire=MagicMock(return_value=False))
+
+        self.assertEqual(self.pipeline.recover(), (0, 1))
+        self.assertEqual(self.collection.find_one({"_id": doc_id})["status"], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import time
+import unittest
+
+from services.response_cache_service import MemoryResponseCache, ResponseCache, normalize_message, response_cache_key
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_key_ignores_case_spacing_and_trailing_punctuation(self):
+        first = response_cache_key("What helps a  headache?", "SYMPTOM", "t1")
+        self.assertEqual(first, response_cache_key("what helps a headache", "SYMPTOM", "t1"))
+        self.assertNotEqual(first, response_cache_key("what helps a headache", "GENERAL", "t1"))
+        self.assertNotEqual(first, response_cache_key("what helps a headache", "SYMPTOM", "t2"))
+        self.assertEqual(normalize_message("  Is  flu contagious?! "), "is flu contagious")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = MemoryResponseCache(max_entries=2)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        cache.get("a")
+        cache.set("c", "C")
+
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "C")
+
+    def test_entries_expire_after_ttl(self):
+        cache = MemoryResponseCache(ttl_seconds=0.05)
+        cache.set("a", "A")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_stats_count_hits_and_misses(self):
+        cache = MemoryResponseCache()
+        cache.get("a")
+        cache.set("a", "A", model_seconds=2.0)
+        cache.get("a")
+        cache.get("a")
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.667)
+        self.assertEqual(stats["estimated_seconds_saved"], 4.0)
+
+    def test_backend_must_implement_storage_methods(self):
+        class NoSize(ResponseCache):
+            def _get(self, key):
+                return None
+
+            def _set(self, key, response):
+                pass
+
+        with self.assertRaises(TypeError):
+            ResponseCache()
+        with self.assertRaises(TypeError):
+            NoSize()
+
+
+if __name__ == "__main__":
+    unittest.main()
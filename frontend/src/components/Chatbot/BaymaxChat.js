@@ -142,7 +142,8 @@ function BaymaxChat() {
       const userId = currentUser ? currentUser.id : "anonymous";
 
       // 🆕 INCLUDE PRESCRIPTION_ID IN REQUEST
-      const response = await fetch('http://localhost:5001/api/chat', {
+      // Streamed as Server-Sent Events so the reply appears while it's generated
+      const response = await fetch('http://localhost:5001/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
@@ -152,19 +153,8 @@ function BaymaxChat() {
         })
       });
 
-      const data = await response.json();
-
-      if (response.ok) {
-        setMessages((prev) => [
-          ...prev,
-          {
-            id: Date.now() + 1,
-            sender: "bot",
-            text: data.response,
-            time: "Now"
-          }
-        ]);
-      } else {
+      if (!response.ok) {
+        const data = await response.json();
         setMessages((prev) => [
           ...prev,
           {
@@ -174,6 +164,54 @@ function BaymaxChat() {
             time: "Now"
           }
         ]);
+        return;
+      }
+
+      const botId = Date.now() + 1;
+      setMessages((prev) => [
+        ...prev,
+        {
+          id: botId,
+          sender: "bot",
+          text: "",
+          time: "Now"
+        }
+      ]);
+
+      const appendToBot = (text) => {
+        setMessages((prev) =>
+          prev.map((msg) => (msg.id === botId ? { ...msg, text: msg.text + text } : msg))
+        );
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();  // keep any partial event for the next read
+
+        for (const rawEvent of events) {
+          let eventName = "message";
+          let payload = "";
+          for (const line of rawEvent.split("\n")) {
+            if (line.startsWith("event: ")) eventName = line.slice(7);
+            if (line.startsWith("data: ")) payload += line.slice(6);
+          }
+          if (!payload) continue;
+
+          const data = JSON.parse(payload);
+          if (eventName === "message") {
+            appendToBot(data.text);
+          } else if (eventName === "error") {
+            appendToBot("\nError: " + (data.error || 'Failed to get response'));
+          }
+        }
       }
     } catch (error) {
       setMessages((prev) => [
@@ -32,6 +32,13 @@ const RESOLUTION_OPTIONS = [
   { id: "yearly", label: "Yearly" },
 ];
 
+// Resolutions bucketed by /api/health-logs/aggregate instead of in the browser
+const SERVER_RESOLUTIONS = {
+  weekly: "week",
+  monthly: "month",
+  yearly: "year",
+};
+
 // Aggregate raw daily data into weekly / monthly / yearly buckets
 function aggregateData(items, resolution) {
   if (!items || items.length === 0) return [];
@@ -257,7 +264,13 @@ useEffect(() => {
       if (startDate) params.append("start", startDate);
       if (endDate) params.append("end", endDate);
 
-      const url = `${API_BASE}/api/health-logs?${params.toString()}`;
+      // Weekly / monthly / yearly buckets are averaged on the server
+      const serverResolution = SERVER_RESOLUTIONS[resolution];
+      if (serverResolution) params.append("resolution", serverResolution);
+
+      const url = serverResolution
+        ? `${API_BASE}/api/health-logs/aggregate?${params.toString()}`
+        : `${API_BASE}/api/health-logs?${params.toString()}`;
       const res = await fetch(url);
 
         if (!res.ok) {
@@ -267,39 +280,58 @@ useEffect(() => {
 
         const raw = await res.json();
 
-        // Handle both array and { data: [...] } shapes
-        const items = Array.isArray(raw) ? raw : raw.data || [];
-
-        // Normalize fields and keep a real Date object for each record
-        const formatted = items.map((item) => {
-          // item.date is "MM-DD-YYYY" from MongoDB
-          const [mm, dd, yyyy] = item.date.split("-");
-          const fullDate = new Date(Number(yyyy), Number(mm) - 1, Number(dd));
-          fullDate.setHours(0, 0, 0, 0);
-
-          return {
-            fullDate,
-            // dateLabel is only used directly in "daily" mode
-            dateLabel: fullDate.toLocaleDateString("en-US", {
-              month: "2-digit",
-              day: "2-digit",
-            }),
-            // Normalized numeric fields for charts
-            sleep:
-              typeof item.sleepHours === "number"
-                ? item.sleepHours
-                : null,
-            vital:
-              typeof item.vital_bpm === "number" ? item.vital_bpm : null,
-            mood: typeof item.mood === "number" ? item.mood : null,
-            medicNumeric:
-              item.tookMedication === true
-                ? 1
-                : item.tookMedication === false
-                  ? 0
+        let formatted;
+        if (serverResolution) {
+          // One pre-averaged point per bucket; aggregateData only builds labels
+          formatted = (raw.buckets || []).map((bucket) => {
+            // bucket.bucket is the bucket's first day as "YYYY-MM-DD"
+            const [yyyy, mm, dd] = bucket.bucket.split("-");
+            const fullDate = new Date(Number(yyyy), Number(mm) - 1, Number(dd));
+            fullDate.setHours(0, 0, 0, 0);
+
+            return {
+              fullDate,
+              sleep: bucket.means.sleepHours,
+              vital: bucket.means.vital_bpm,
+              mood: bucket.means.mood,
+              medicNumeric: bucket.means.tookMedication,
+            };
+          });
+        } else {
+          // Handle both array and { data: [...] } shapes
+          const items = Array.isArray(raw) ? raw : raw.data || [];
+
+          // Normalize fields and keep a real Date object for each record
+          formatted = items.map((item) => {
+            // item.date is "MM-DD-YYYY" from MongoDB
+            const [mm, dd, yyyy] = item.date.split("-");
+            const fullDate = new Date(Number(yyyy), Number(mm) - 1, Number(dd));
+            fullDate.setHours(0, 0, 0, 0);
+
+            return {
+              fullDate,
+              // dateLabel is only used directly in "daily" mode
+              dateLabel: fullDate.toLocaleDateString("en-US", {
+                month: "2-digit",
+                day: "2-digit",
+              }),
+              // Normalized numeric fields for charts
+              sleep:
+                typeof item.sleepHours === "number"
+                  ? item.sleepHours
                   : null,
-          };
-        });
+              vital:
+                typeof item.vital_bpm === "number" ? item.vital_bpm : null,
+              mood: typeof item.mood === "number" ? item.mood : null,
+              medicNumeric:
+                item.tookMedication === true
+                  ? 1
+                  : item.tookMedication === false
+                    ? 0
+                    : null,
+            };
+          });
+        }
 
         setRawData(formatted);
       } catch (err) {
@@ -312,7 +344,7 @@ useEffect(() => {
     };
 
     fetchData();
-  }, [userId, startDate, endDate, isRangeInvalid]); 
+  }, [userId, startDate, endDate, resolution, isRangeInvalid]); 
 
   const hasData = aggregatedData.length > 0;
 
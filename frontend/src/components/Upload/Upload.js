@@ -3,11 +3,24 @@ import { useNavigate } from "react-router-dom";
 import { supabase } from "../../SupabaseClient";
 import "./Upload.css";
 
+const API_URL = "http://localhost:5001";
+const POLL_INTERVAL_MS = 1000;
+const POLL_TIMEOUT_MS = 3 * 60 * 1000;
+
+const STAGE_LABELS = {
+  extraction: "Extracting text",
+  parsing: "Finding medications",
+  explanation: "Writing a summary",
+};
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 function Upload() {
   const [file, setFile] = useState(null);
   const [prescription, setPrescription] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [stages, setStages] = useState(null);
   const navigate = useNavigate();
 
   const handleFileChange = (e) => {
@@ -32,6 +45,34 @@ function Upload() {
     setFile(selectedFile);
   };
 
+  // Processing runs in the background; poll until every stage has finished
+  const pollPrescription = async (prescriptionId) => {
+    const deadline = Date.now() + POLL_TIMEOUT_MS;
+
+    while (Date.now() < deadline) {
+      const response = await fetch(`${API_URL}/api/prescription/${prescriptionId}`);
+      const data = await response.json();
+
+      if (!response.ok) {
+        throw new Error(data.error || "Could not load processing status");
+      }
+
+      setStages(data.stages);
+
+      if (data.status === "completed") {
+        return { ...data, prescription_id: data._id, explanation: data.ai_explanation };
+      }
+      if (data.status === "failed") {
+        const failed = Object.values(data.stages || {}).find((stage) => stage.status === "failed");
+        throw new Error((failed && failed.error) || "Processing failed");
+      }
+
+      await sleep(POLL_INTERVAL_MS);
+    }
+
+    throw new Error("Processing is taking longer than expected. Please try again later.");
+  };
+
   const handleUpload = async () => {
     if (!file) {
       setError("Please select a file first.");
@@ -40,6 +81,7 @@ function Upload() {
 
     setLoading(true);
     setError(null);
+    setStages(null);
 
     try {
       // Get current user
@@ -54,15 +96,19 @@ function Upload() {
       formData.append("user_id", userId);
 
       // Upload to backend
-      const response = await fetch("http://localhost:5001/api/prescription/upload", {
+      const response = await fetch(`${API_URL}/api/prescription/upload`, {
         method: "POST",
         body: formData,
       });
 
       const data = await response.json();
 
-      if (response.ok) {
-        setPrescription(data);
+      if (response.status === 429) {
+        const retryAfter = response.headers.get("Retry-After");
+        setError(`The server is busy. Please try again in ${retryAfter || "a few"} seconds.`);
+      } else if (response.ok) {
+        setStages(data.stages);
+        setPrescription(await pollPrescription(data.prescription_id));
       } else {
         setError(data.error || "Upload failed");
       }
@@ -81,6 +127,7 @@ function Upload() {
     setFile(null);
     setPrescription(null);
     setError(null);
+    setStages(null);
   };
 
   return (
@@ -149,6 +196,15 @@ function Upload() {
                 <span className="loading-hint">
                   Extracting text and generating a summary...
                 </span>
+                {stages && (
+                  <ul className="stage-list">
+                    {Object.entries(STAGE_LABELS).map(([stage, label]) => (
+                      <li key={stage} className={`stage-${stages[stage]?.status || "pending"}`}>
+                        {label}: {stages[stage]?.status || "pending"}
+                      </li>
+                    ))}
+                  </ul>
+                )}
               </div>
             )}
           </div>